@@ -0,0 +1,106 @@
+import numpy as np
+import pandas
+
+KEY_COLUMNS = ['N', 'p', 'q', 'r', 'observable']
+
+
+class StreamedSums(object):
+    """Per-parameter sums of vector observables over samples. Only the sums and the number
+    of samples are kept, so accumulators from different iterations, processes or shards can
+    be merged by adding them up."""
+
+    def __init__(self):
+        self.sums = {}
+        self.nsamples = {}
+
+    def add(self, key, name, value, nsamples=1):
+        k = tuple(key) + (name,)
+        value = np.asarray(value, dtype=float)
+        if k in self.sums:
+            self.sums[k] = _padded_sum(self.sums[k], value)
+            self.nsamples[k] += nsamples
+        else:
+            self.sums[k] = value.copy()
+            self.nsamples[k] = nsamples
+
+    def merge(self, other):
+        for k in other.sums:
+            self.add(k[:-1], k[-1], other.sums[k], other.nsamples[k])
+        return self
+
+    def mean(self, key, name):
+        k = tuple(key) + (name,)
+        return self.sums[k] / self.nsamples[k]
+
+    def to_dataframe(self):
+        rows = []
+        for k in sorted(self.sums, key=str):
+            row = dict(zip(KEY_COLUMNS, k))
+            row['nsamples'] = self.nsamples[k]
+            row.update(enumerate(self.sums[k]))
+            rows.append(row)
+        return pandas.DataFrame(rows)
+
+    def save(self, path):
+        self.to_dataframe().to_csv(path, index=False)
+
+
+def _padded_sum(a, b):
+    # vectors like the cluster histograms may grow with the largest cluster seen
+    if len(a) < len(b):
+        a, b = b, a
+    a = a.copy()
+    a[:len(b)] += b
+    return a
+
+
+def load_streamed(path):
+    acc = StreamedSums()
+    df = pandas.read_csv(path)
+    value_columns = [c for c in df.columns if c not in KEY_COLUMNS + ['nsamples']]
+    for _, row in df.iterrows():
+        values = row[value_columns].to_numpy(dtype=float)
+        values = values[:len(values) - np.argmax(~np.isnan(values[::-1]))]
+        key = (int(row['N']), row['p'], row['q'], row['r'])
+        acc.add(key, row['observable'], values, int(row['nsamples']))
+    return acc
+
+
+def merge_streamed(paths):
+    acc = StreamedSums()
+    for path in paths:
+        acc.merge(load_streamed(path))
+    return acc
+
+
+class RunningStats(object):
+    """Running mean and variance (Welford) of scalar observables per parameter point."""
+
+    def __init__(self):
+        self.n = {}
+        self.means = {}
+        self.m2 = {}
+
+    def add(self, key, name, value):
+        k = tuple(key) + (name,)
+        value = float(value)
+        if np.isnan(value):
+            return
+        n = self.n.get(k, 0) + 1
+        delta = value - self.means.get(k, 0.0)
+        self.n[k] = n
+        self.means[k] = self.means.get(k, 0.0) + delta / n
+        self.m2[k] = self.m2.get(k, 0.0) + delta * (value - self.means[k])
+
+    def count(self, key, name):
+        return self.n.get(tuple(key) + (name,), 0)
+
+    def mean(self, key, name):
+        return self.means.get(tuple(key) + (name,), np.nan)
+
+    def var(self, key, name):
+        n = self.count(key, name)
+        return self.m2[tuple(key) + (name,)] / (n - 1) if n > 1 else np.nan
+
+    def sem(self, key, name):
+        return np.sqrt(self.var(key, name) / self.count(key, name)) if self.count(key, name) > 1 else np.nan
@@ -0,0 +1,39 @@
+import percolation.strategies as st
+import argparse
+import os
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the simplification strategies and pick the fastest valid one per parameter point.")
+    parser.add_argument("-N", nargs='*', type=int, default=[24], help="List of N values")
+    parser.add_argument("--t_factor", type=int, default=4,
+                        help="Value for t_factor")
+    parser.add_argument("--niterations", type=int,
+                        default=5, help="Number of sampled circuits per point")
+    parser.add_argument("-p", nargs='*', type=float,
+                        default=[0.1], help="Value for p")
+    parser.add_argument("-q", nargs='*', type=float,
+                        default=[0.5], help="Value for q")
+    parser.add_argument("-r", nargs='*', type=float,
+                        default=[0.1], help="List of r values")
+    parser.add_argument("--strategies", nargs='*', default=list(st.SIMP_STRATEGIES),
+                        choices=list(st.SIMP_STRATEGIES), help="strategies to benchmark")
+    parser.add_argument(
+        "--save_path", help="path in which to save the calibration", default="data/calibration")
+    parser.add_argument("--periodic", action='store_true')
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    os.makedirs(args.save_path, exist_ok=True)
+
+    calibration_df = st.calibrate(args.N, args.t_factor, args.p, args.q, args.r,
+                                  args.niterations, args.strategies, args.periodic)
+    calibration_df.to_csv(f"{args.save_path}/calibration.csv")
+    strategy_table = st.select_strategies(calibration_df)
+    strategy_table.to_csv(f"{args.save_path}/strategy_table.csv")
+    print(strategy_table)
+    print(f"calibration is done. args were: {args}")
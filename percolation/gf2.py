@@ -0,0 +1,57 @@
+import numpy as np
+
+# rows of GF(2) matrices are packed little-endian into words of 64 bits: column c is bit
+# c % 64 of word c // 64
+WORD_BITS = 64
+
+
+def pack_rows(matrix):
+    """(m, n) array of 0/1 -> (m, ceil(n / 64)) uint64 array."""
+    matrix = np.asarray(matrix, dtype=bool)
+    m, n = matrix.shape
+    nwords = max(1, -(-n // WORD_BITS))
+    padded = np.zeros((m, nwords * WORD_BITS), dtype=bool)
+    padded[:, :n] = matrix
+    packed = np.packbits(padded, axis=1, bitorder='little')
+    return np.ascontiguousarray(packed).view(np.uint64).reshape(m, nwords)
+
+
+def unpack_rows(packed, n):
+    bits = np.unpackbits(np.ascontiguousarray(packed).view(np.uint8), axis=1, bitorder='little')
+    return bits[:, :n].astype(bool)
+
+
+def rank_packed(packed, ncols=None):
+    """Rank over GF(2) of a packed matrix, by Gaussian elimination on whole words: every pivot
+    is XORed into the rows below it with one vectorized operation. The argument is modified."""
+    m, nwords = packed.shape
+    if ncols is None:
+        ncols = nwords * WORD_BITS
+    rank = 0
+    for c in range(ncols):
+        if rank == m:
+            break
+        w = c // WORD_BITS
+        bit = np.uint64(1) << np.uint64(c % WORD_BITS)
+        column = (packed[rank:, w] & bit) != 0
+        if not column.any():
+            continue
+        pivot = rank + np.argmax(column)
+        if pivot != rank:
+            packed[[rank, pivot]] = packed[[pivot, rank]]
+            column[[0, pivot - rank]] = column[[pivot - rank, 0]]
+        below = rank + 1 + np.flatnonzero(column[1:])
+        # the words before w are already zero in the pivot row
+        packed[below, w:] ^= packed[rank, w:]
+        rank += 1
+    return rank
+
+
+def rank(matrix):
+    matrix = np.asarray(matrix, dtype=bool)
+    if matrix.shape[0] > matrix.shape[1]:
+        # fewer, longer rows are cheaper to eliminate
+        matrix = matrix.T
+    if matrix.size == 0:
+        return 0
+    return rank_packed(pack_rows(matrix), matrix.shape[1])
@@ -0,0 +1,98 @@
+import numpy as np
+import pyzx as zx
+import percolation.gf2 as gf2
+
+
+class GraphState(object):
+    """Output state of a reduced Clifford diagram as a graph state up to local Cliffords.
+
+    qubits:    pyzx ids of the outputs, in the order of g.outputs()
+    adjacency: (N, N) bool adjacency matrix of the graph on the qubits
+    """
+
+    def __init__(self, qubits, adjacency):
+        self.qubits = qubits
+        self.adjacency = adjacency
+
+    def entropy(self, subsystem):
+        """Entanglement entropy (in bits) of the qubits at positions `subsystem`, which is the
+        GF(2) rank of the block of the adjacency matrix between them and the rest."""
+        inside = np.zeros(len(self.qubits), dtype=bool)
+        inside[list(subsystem)] = True
+        return gf2.rank(self.adjacency[np.ix_(inside, ~inside)])
+
+    def entropy_profile(self, sizes=None, start=0):
+        # S(l) for the contiguous (wrapping) subsystems start, ..., start + l - 1
+        N = len(self.qubits)
+        if sizes is None:
+            sizes = range(1, N//2 + 1)
+        return [self.entropy((start + np.arange(l)) % N) for l in sizes]
+
+
+def reduced_state(g):
+    """Copy of g with the inputs in |0> (as in input_to_X), fully reduced into graph-like form."""
+    g = g.copy()
+    vertices = set(g.vertices())
+    for v in g.inputs():
+        if v in vertices:
+            g.set_type(v, zx.VertexType.X)
+    g.set_inputs(())
+    zx.full_reduce(g, quiet=True)
+    return g
+
+
+def _is_pauli(phase):
+    return phase % 1 == 0
+
+
+def graph_state(g):
+    """Reads the graph state off a graph-like diagram of a state (see reduced_state).
+
+    Every spider is attached to some outputs, whose legs are local Cliffords. A spider with
+    several outputs is equivalent to its first output with the others as leaves of it, and
+    an output wired straight to another output is a Bell pair, i.e. an edge. full_reduce can
+    leave degree one Pauli spiders behind, which put their neighbour in a Z eigenstate: that
+    neighbour is cut off from the rest and its outputs are left in a product state.
+    Returns None for a zero diagram, whose entropies are undefined."""
+    if g.scalar.is_zero:
+        return None
+    qubits = [v for v in g.outputs() if g.type(v) == zx.VertexType.BOUNDARY]
+    position = {v: i for i, v in enumerate(qubits)}
+    is_boundary = {v: g.type(v) == zx.VertexType.BOUNDARY for v in g.vertices()}
+
+    cut = set()
+    spiders = [v for v in g.vertices() if not is_boundary[v]]
+    for v in spiders:
+        neighbors = list(g.neighbors(v))
+        if any(is_boundary[n] for n in neighbors) or not neighbors:
+            continue
+        if len(neighbors) == 1:
+            n = neighbors[0]
+            if (_is_pauli(g.phase(v))
+                    and g.edge_type(g.edge(v, n)) == zx.EdgeType.HADAMARD):
+                cut.add(n)
+            # otherwise it is a local Clifford on n
+            continue
+        raise ValueError(f"spider {v} is not attached to any output, the diagram is not "
+                         f"reduced to a graph state")
+
+    adjacency = np.zeros((len(qubits), len(qubits)), dtype=bool)
+    representative = {}
+    for v in spiders:
+        outputs = sorted(position[n] for n in g.neighbors(v) if n in position)
+        if not outputs or v in cut:
+            continue
+        representative[v] = outputs[0]
+        adjacency[outputs[0], outputs[1:]] = True
+        adjacency[outputs[1:], outputs[0]] = True
+
+    for u, v in g.edges():
+        if u in position and v in position:
+            adjacency[position[u], position[v]] = adjacency[position[v], position[u]] = True
+        elif u in representative and v in representative:
+            if g.edge_type((u, v)) != zx.EdgeType.HADAMARD:
+                raise ValueError(f"simple edge between spiders {u} and {v}, the diagram is "
+                                 f"not graph-like")
+            adjacency[representative[u], representative[v]] = True
+            adjacency[representative[v], representative[u]] = True
+    return GraphState(qubits, adjacency)
@@ -0,0 +1,177 @@
+from collections import deque
+import numpy as np
+import pyzx as zx
+import percolation.sparse_graph as sg
+import percolation.util_functions as uf
+
+
+class FlowNetwork(object):
+    """Max-flow on an undirected graph with unit edge capacities, stored as CSR arrays.
+
+    Every undirected edge is the pair of arcs (k, rev[k]) with antisymmetric flow, so the
+    residual capacity of arc k is 1 - flow[k]. Sources and sinks are sets of vertices with
+    infinite capacity to a virtual super source / sink, so the graph is never copied.
+    Uses Dinic's blocking flows; with unit capacities the number of phases is
+    O(min(V^(2/3), E^(1/2))) (Even-Tarjan), each phase costing O(E)."""
+
+    def __init__(self, adjacency):
+        adjacency = adjacency.tocsr()
+        adjacency.sort_indices()
+        self.num_vertices = adjacency.shape[0]
+        self.indptr = adjacency.indptr.tolist()
+        self.indices = adjacency.indices.tolist()
+        # adjacency is symmetric, so sorting the arcs by (head, tail) gives the reverse arcs
+        tails = np.repeat(np.arange(self.num_vertices), np.diff(adjacency.indptr))
+        self.rev = np.lexsort((tails, adjacency.indices)).tolist()
+        self.reset()
+
+    def reset(self):
+        self.flow = [0] * len(self.indices)
+        self.value = 0
+
+    def degree(self, v):
+        return self.indptr[v + 1] - self.indptr[v]
+
+    def net_outflow(self, v):
+        return sum(self.flow[self.indptr[v]:self.indptr[v + 1]])
+
+    def _levels(self, is_source, is_sink, sources):
+        level = [-1] * self.num_vertices
+        queue = deque()
+        for s in sources:
+            level[s] = 0
+            queue.append(s)
+        sink_level = -1
+        indptr, indices, flow = self.indptr, self.indices, self.flow
+        while queue:
+            u = queue.popleft()
+            if sink_level != -1 and level[u] >= sink_level:
+                break
+            for k in range(indptr[u], indptr[u + 1]):
+                v = indices[k]
+                if level[v] == -1 and flow[k] < 1:
+                    level[v] = level[u] + 1
+                    if is_sink[v]:
+                        sink_level = level[v]
+                    else:
+                        queue.append(v)
+        return level, sink_level
+
+    def _blocking_flow(self, level, is_sink, sources, limit):
+        indptr, indices, flow, rev = self.indptr, self.indices, self.flow, self.rev
+        current = indptr[:-1]
+        pushed = 0
+        for s in sources:
+            stack, path = [s], []
+            while stack and pushed < limit:
+                u = stack[-1]
+                if is_sink[u]:
+                    for k in path:
+                        flow[k] += 1
+                        flow[rev[k]] -= 1
+                    pushed += 1
+                    stack, path = [s], []
+                    continue
+                advanced = False
+                while current[u] < indptr[u + 1]:
+                    k = current[u]
+                    v = indices[k]
+                    if flow[k] < 1 and level[v] == level[u] + 1:
+                        stack.append(v)
+                        path.append(k)
+                        advanced = True
+                        break
+                    current[u] += 1
+                if not advanced:
+                    # dead end, never enter u again in this phase
+                    level[u] = -1
+                    stack.pop()
+                    if path:
+                        path.pop()
+                        current[stack[-1]] += 1
+        return pushed
+
+    def max_flow(self, sources, sinks, bound=None):
+        """Augments the current flow to a maximum flow from `sources` to `sinks` and returns
+        its value. `bound` stops the search early once that many units were found; by default
+        it is the total degree of the smaller side, i.e. min(|S|, |T|) for degree one boundaries.
+        The current flow only has to be conserved away from the terminals, so it can be left
+        over from a cut with the same terminals split differently (see cut_profile)."""
+        sources, sinks = list(sources), list(sinks)
+        is_source = [False] * self.num_vertices
+        is_sink = [False] * self.num_vertices
+        for s in sources:
+            is_source[s] = True
+        for t in sinks:
+            if is_source[t]:
+                return np.inf
+            is_sink[t] = True
+        if bound is None:
+            bound = min(sum(self.degree(s) for s in sources),
+                        sum(self.degree(t) for t in sinks))
+        self.value = sum(self.net_outflow(s) for s in sources)
+
+        while self.value < bound:
+            level, sink_level = self._levels(is_source, is_sink, sources)
+            if sink_level == -1:
+                break
+            pushed = self._blocking_flow(level, is_sink, sources, bound - self.value)
+            if pushed == 0:
+                break
+            self.value += pushed
+        return self.value
+
+
+def st_initial_to_final(diagram):
+    return diagram.inputs, diagram.outputs
+
+
+def st_final_time(diagram):
+    N = len(diagram.outputs)
+    return diagram.outputs[:N//2], diagram.outputs[N//2:]
+
+
+def cut_profile(diagram, network=None, start=0):
+    """Min cuts S(l) between the l contiguous outputs start, ..., start + l - 1 (wrapping
+    around, as for periodic circuits) and the rest of the outputs, for l = 1..N//2.
+    Going from l to l + 1 moves one output from the sinks to the sources. The terminals
+    stay the same, so the previous flow is still valid and only has to be augmented."""
+    outputs = list(diagram.outputs)
+    N = len(outputs)
+    outputs = outputs[start:] + outputs[:start]
+    if network is None:
+        network = FlowNetwork(diagram.adjacency)
+    network.reset()
+    return [network.max_flow(outputs[:l], outputs[l:]) for l in range(1, N//2 + 1)]
+
+
+def input_to_X(g, **kwargs):
+    g = g.copy()
+    vertices = set(g.vertices())
+    for v in g.inputs():
+        if v in vertices:
+            g.set_type(v, zx.VertexType.X)
+    uf.simplify_circuit(g, kwargs['quiet'], simp_method=kwargs['simp_method'])
+    return sg.pyzx_to_csr(g)
+
+
+def min_cut(diagram, st_func):
+    sources, targets = st_func(diagram)
+    return FlowNetwork(diagram.adjacency).max_flow(sources, targets)
+
+
+def min_cut_first(G, g, **kwargs):
+    return min_cut(sg.as_sparse_diagram(G, g), st_initial_to_final)
+
+
+def min_cut_two_halves(G, g, **kwargs):
+    return min_cut(sg.as_sparse_diagram(G, g), st_final_time)
+
+
+def min_cut_X(G, g, **kwargs):
+    return min_cut(input_to_X(g, **kwargs), st_final_time)
+
+
+def min_cut_hfunction(G, g, **kwargs):
+    # drop-in for util_functions.min_cut_hfunction
+    return min_cut_first(G, g, **kwargs)
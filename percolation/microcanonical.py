@@ -0,0 +1,153 @@
+import numpy as np
+from scipy import stats
+import percolation.spacetime as spt
+import percolation.union_find as ufind
+
+rng = np.random.default_rng()
+
+# the observables of the same name in observables.py, computed on the circuits of a sweep
+SWEEP_OBSERVABLES = ['largest_spacetime_cluster', 'spans_time']
+
+
+class Sweep(object):
+    """One realization of the microcanonical ensemble, in the spirit of Newman-Ziff.
+
+    Every gate slot gets both a unitary (swap, lcnot or rcnot, according to r) and a
+    measurement (id or Bell projection, according to q), and the slots are turned from the
+    first into the second in one random order. string_circuit(n) is the circuit in which the
+    first n slots of that order are measurements, so averaging over n ~ Binomial(nslots, p)
+    gives the circuits of sample_string_circuit at p."""
+
+    def __init__(self, N, t_factor, q, r, periodic=False):
+        self.N = N
+        self.periodic = periodic
+        total_t = int(N * t_factor) // 2 * 2
+        self.shape = (total_t, N // 2)
+        q1 = spt.slot_qubits(N, np.empty(self.shape))
+        # slots reaching past the last qubit are idle in open circuits
+        self.valid = (q1 + 1 < N) | periodic
+        self.nslots = int(self.valid.sum())
+
+        cnots = rng.random(self.nslots) < r
+        self.unitaries = np.where(
+            cnots, np.where(rng.random(self.nslots) < 0.5, "lcnot", "rcnot"), "swap")
+        self.measurements = np.where(
+            rng.random(self.nslots) < q, "bell_projection", "id_projection")
+        # position[k]: the step at which slot k becomes a measurement
+        self.position = rng.permutation(self.nslots)
+
+    def string_circuit(self, n):
+        circuit = np.full(self.shape, '*' * 15)
+        circuit[~self.valid] = ""
+        circuit[self.valid] = np.where(self.position < n, self.measurements, self.unitaries)
+        return circuit
+
+
+class _SweepClusters(object):
+    # clusters of the spacetime graph with the observables kept up to date under rollbacks
+
+    def __init__(self, num_vertices, inputs, outputs):
+        self.uf = ufind.RollbackUnionFind(num_vertices)
+        self.has_input = [False] * num_vertices
+        self.has_output = [False] * num_vertices
+        for v in inputs:
+            self.has_input[v] = True
+        for v in outputs:
+            self.has_output[v] = True
+        self.largest = 1
+        self.spanning = sum(self.has_input[v] and self.has_output[v] for v in range(num_vertices))
+        self.saved = []
+
+    def _spans(self, root):
+        return self.has_input[root] and self.has_output[root]
+
+    def union(self, u, v):
+        merged = self.uf.union(u, v)
+        if merged is None:
+            return
+        ru, rv = merged
+        self.saved.append((self.largest, self.spanning, self.has_input[ru], self.has_output[ru]))
+        self.spanning -= self._spans(ru) + self._spans(rv)
+        self.has_input[ru] = self.has_input[ru] or self.has_input[rv]
+        self.has_output[ru] = self.has_output[ru] or self.has_output[rv]
+        self.spanning += self._spans(ru)
+        self.largest = max(self.largest, self.uf.size[ru])
+
+    def mark(self):
+        return len(self.uf.history)
+
+    def rollback(self, mark):
+        uf = self.uf
+        while len(uf.history) > mark:
+            ru = uf.parent[uf.history[-1]]
+            self.largest, self.spanning, self.has_input[ru], self.has_output[ru] = self.saved.pop()
+            uf.rollback(len(uf.history) - 1)
+
+
+def _edge_intervals(sweep):
+    """Edges of the spacetime graphs of the all-unitary and the all-measurement circuits,
+    with the steps [first, last] during which they are present: the edges of a unitary
+    until its slot is converted, those of the measurement from then on."""
+    N, periodic = sweep.N, sweep.periodic
+    slot_index = np.full(sweep.valid.size, -1)
+    slot_index[sweep.valid.ravel()] = np.arange(sweep.nslots)
+
+    unitary = spt.spacetime_graph(sweep.string_circuit(0), N, periodic)
+    measured = spt.spacetime_graph(sweep.string_circuit(sweep.nslots), N, periodic)
+    # the idle wires of open circuits (slot -1) are always there, take them once
+    idle = unitary.slot < 0
+    k = slot_index[unitary.slot[~idle]]
+    measured_k = slot_index[measured.slot[measured.slot >= 0]]
+
+    edges = np.concatenate([unitary.edges[idle], unitary.edges[~idle],
+                            measured.edges[measured.slot >= 0]])
+    first = np.concatenate([np.zeros(idle.sum(), dtype=np.int64), np.zeros(len(k), dtype=np.int64),
+                            sweep.position[measured_k] + 1])
+    last = np.concatenate([np.full(idle.sum(), sweep.nslots), sweep.position[k],
+                           np.full(len(measured_k), sweep.nslots)])
+    return unitary, edges, first, last
+
+
+def sweep_observables(sweep):
+    """Cluster observables of the spacetime graph of string_circuit(n) for every n = 0..nslots.
+
+    Converting a slot removes the edges of its unitary and adds those of its measurement, so
+    clusters can't just be grown as in Newman-Ziff. Every edge is present on an interval of
+    steps though, which the divide and conquer over the steps assigns to O(log nslots) nodes;
+    their unions are made going down and rolled back going up, O(E log(nslots)) in total.
+
+    largest_spacetime_cluster: fraction of the spacetime vertices in the largest cluster
+    spans_time:                some cluster connects the inputs to the outputs
+    """
+    spacetime, edges, first, last = _edge_intervals(sweep)
+    clusters = _SweepClusters(spacetime.num_vertices, spacetime.inputs.tolist(),
+                              spacetime.outputs.tolist())
+    largest = np.zeros(sweep.nslots + 1)
+    spans = np.zeros(sweep.nslots + 1, dtype=bool)
+
+    def solve(lo, hi, edges, first, last):
+        mark = clusters.mark()
+        full = (first <= lo) & (last >= hi)
+        for u, v in edges[full].tolist():
+            clusters.union(u, v)
+        if lo == hi:
+            largest[lo] = clusters.largest
+            spans[lo] = clusters.spanning > 0
+        else:
+            edges, first, last = edges[~full], first[~full], last[~full]
+            mid = (lo + hi) // 2
+            left, right = first <= mid, last > mid
+            solve(lo, mid, edges[left], first[left], last[left])
+            solve(mid + 1, hi, edges[right], first[right], last[right])
+        clusters.rollback(mark)
+
+    solve(0, sweep.nslots, edges, first, last)
+    return {'largest_spacetime_cluster': largest / spacetime.num_vertices, 'spans_time': spans.astype(float)}
+
+
+def canonical(values, nslots, ps):
+    """Averages of the microcanonical `values` (indexed by n = 0..nslots) over
+    n ~ Binomial(nslots, p), for every p in `ps`."""
+    n = np.arange(nslots + 1)
+    weights = stats.binom.pmf(n[None, :], nslots, np.asarray(ps, dtype=float)[:, None])
+    return weights @ np.asarray(values)
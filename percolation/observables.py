@@ -0,0 +1,270 @@
+import numpy as np
+import percolation.sparse_graph as sg
+import percolation.maxflow as mf
+import percolation.spacetime as spt
+import percolation.graph_state as gs
+import percolation.stabilizer as stab
+import percolation.reweighting as rw
+
+# name -> (names of the intermediates it needs, function of a Sample)
+INTERMEDIATES = {}
+OBSERVABLES = {}
+# observables which are summed per parameter point (accumulators.StreamedSums) instead of
+# being stored for every sample
+STREAMED_OBSERVABLES = set()
+
+# the columns written by run_all_hfunction in widget/wcore/util_functions.py
+DEFAULT_OBSERVABLES = ['lc', 'slc', 'is_path', 'min_cut', 'min_cut_ff', 'min_cut_X']
+
+
+def intermediate(name, requires=()):
+    def decorator(function):
+        INTERMEDIATES[name] = (tuple(requires), function)
+        return function
+    return decorator
+
+
+def observable(name, requires=(), streamed=False):
+    def decorator(function):
+        OBSERVABLES[name] = (tuple(requires), function)
+        if streamed:
+            STREAMED_OBSERVABLES.add(name)
+        return function
+    return decorator
+
+
+class Sample(object):
+    """One simplified diagram together with its intermediates, each of which is computed
+    at most once, the first time an observable asks for it."""
+
+    def __init__(self, G, g, **kwargs):
+        self.G = G
+        self.g = g
+        self.kwargs = kwargs
+        self.cache = {}
+
+    def get(self, name):
+        if name not in self.cache:
+            requires, function = INTERMEDIATES[name]
+            for dependency in requires:
+                self.get(dependency)
+            self.cache[name] = function(self)
+        return self.cache[name]
+
+
+class ObservableEngine(object):
+    """hfunction computing the chosen observables of a sample, sharing the intermediates
+    between them. G can be the networkx graph or a SparseDiagram (to_graph=sg.pyzx_to_csr)."""
+
+    def __init__(self, observables=None):
+        if observables is None:
+            observables = DEFAULT_OBSERVABLES
+        unknown = [name for name in observables if name not in OBSERVABLES]
+        if unknown:
+            raise ValueError(
+                f"unknown observables {unknown}, choose from {list(OBSERVABLES)}")
+        self.observables = list(observables)
+
+    def __call__(self, G, g, **kwargs):
+        sample = Sample(G, g, **kwargs)
+        output = {}
+        for name in self.observables:
+            requires, function = OBSERVABLES[name]
+            for dependency in requires:
+                sample.get(dependency)
+            value = function(sample)
+            if name in STREAMED_OBSERVABLES:
+                output[name] = value
+            elif isinstance(value, dict):
+                # vector observables are stored as one column per entry, next to the scalars
+                output.update({f"{name}_{key}": v for key, v in value.items()})
+            else:
+                output[name] = value
+        return output
+
+
+### INTERMEDIATES
+
+@intermediate('diagram')
+def _diagram(sample):
+    return sg.as_sparse_diagram(sample.G, sample.g)
+
+
+@intermediate('labels', requires=['diagram'])
+def _labels(sample):
+    return sg.component_labels(sample.get('diagram'))
+
+
+@intermediate('components', requires=['diagram', 'labels'])
+def _components(sample):
+    ncomponents, labels = sample.get('labels')
+    return sg.component_observables(sample.get('diagram'), ncomponents, labels)
+
+
+@intermediate('flow_network', requires=['diagram'])
+def _flow_network(sample):
+    return mf.FlowNetwork(sample.get('diagram').adjacency)
+
+
+@intermediate('x_diagram')
+def _x_diagram(sample):
+    return mf.input_to_X(sample.g, **sample.kwargs)
+
+
+@intermediate('x_flow_network', requires=['x_diagram'])
+def _x_flow_network(sample):
+    return mf.FlowNetwork(sample.get('x_diagram').adjacency)
+
+
+@intermediate('spacetime')
+def _spacetime(sample):
+    # the circuit before simplification, rebuilt from the gate array
+    return spt.spacetime_graph(sample.kwargs['string_circuit'], sample.kwargs['N'],
+                               sample.kwargs.get('periodic', False))
+
+
+@intermediate('wrapping', requires=['spacetime'])
+def _wrapping(sample):
+    return spt.wrapping_observables(sample.get('spacetime'), sample.kwargs.get('periodic', False))
+
+
+@intermediate('connection_vs_depth', requires=['spacetime'])
+def _connection_vs_depth(sample):
+    return spt.connection_vs_depth(sample.get('spacetime'))
+
+
+@intermediate('graph_state')
+def _graph_state(sample):
+    # None if the post-selections have zero probability
+    return gs.graph_state(gs.reduced_state(sample.g))
+
+
+@intermediate('tableau')
+def _tableau(sample):
+    # the same circuit simulated on |0...0>, independently of the diagram
+    return stab.simulate(sample.kwargs['string_circuit'], sample.kwargs['N'],
+                         sample.kwargs.get('periodic', False))
+
+
+def _min_cut(network, diagram, st_func):
+    # networks are shared between observables, so every cut starts from zero flow
+    network.reset()
+    return network.max_flow(*st_func(diagram))
+
+
+### OBSERVABLES
+
+@observable('lc', requires=['components'])
+def lc(sample):
+    return sample.get('components')[0]
+
+
+@observable('slc', requires=['components'])
+def slc(sample):
+    return sample.get('components')[1]
+
+
+@observable('is_path', requires=['components'])
+def is_path(sample):
+    return sample.get('components')[2]
+
+
+@observable('min_cut', requires=['diagram', 'flow_network'])
+def min_cut(sample):
+    return _min_cut(sample.get('flow_network'), sample.get('diagram'), mf.st_initial_to_final)
+
+
+@observable('min_cut_ff', requires=['diagram', 'flow_network'])
+def min_cut_ff(sample):
+    return _min_cut(sample.get('flow_network'), sample.get('diagram'), mf.st_final_time)
+
+
+@observable('min_cut_X', requires=['x_diagram', 'x_flow_network'])
+def min_cut_X(sample):
+    return _min_cut(sample.get('x_flow_network'), sample.get('x_diagram'), mf.st_final_time)
+
+
+@observable('cut_profile', requires=['diagram', 'flow_network'])
+def cut_profile(sample):
+    # S(l) for contiguous output subsystems of size l = 1..N//2, stored as cut_profile_<l>
+    profile = mf.cut_profile(sample.get('diagram'), sample.get('flow_network'))
+    return {l + 1: S for l, S in enumerate(profile)}
+
+
+@observable('cluster_sizes', requires=['diagram', 'labels'], streamed=True)
+def cluster_sizes(sample):
+    # log2-binned cluster numbers per vertex, averaged per (N, p, q, r) into n_s
+    ncomponents, labels = sample.get('labels')
+    return sg.cluster_size_histogram(sample.get('diagram'), ncomponents, labels)
+
+
+@observable('wraps_space', requires=['wrapping'])
+def wraps_space(sample):
+    # some cluster winds around the qubits, only possible with --periodic
+    return sample.get('wrapping')[0]
+
+
+@observable('spans_space', requires=['wrapping'])
+def spans_space(sample):
+    return sample.get('wrapping')[1]
+
+
+@observable('spans_time', requires=['wrapping'])
+def spans_time(sample):
+    return sample.get('wrapping')[2]
+
+
+@observable('largest_spacetime_cluster', requires=['spacetime'])
+def largest_spacetime_cluster(sample):
+    # the lc of the circuit before simplification, as computed by --microcanonical
+    return spt.largest_cluster(sample.get('spacetime'))
+
+
+@observable('output_connectivity', requires=['diagram', 'labels'], streamed=True)
+def output_connectivity(sample):
+    # P(outputs i and j share a cluster) against |i - j|, averaged per (N, p, q, r)
+    labels = sample.get('labels')[1]
+    return sg.output_connectivity(sample.get('diagram'), labels, sample.kwargs.get('periodic', False))
+
+
+@observable('disconnection_depth', requires=['connection_vs_depth'])
+def disconnection_depth(sample):
+    # in layers, nan if the whole circuit still connects the inputs to the outputs
+    return spt.disconnection_depth(sample.get('connection_vs_depth'))
+
+
+@observable('connected_vs_depth', requires=['connection_vs_depth'], streamed=True)
+def connected_vs_depth(sample):
+    # averaged per (N, p, q, r), the probability that d layers still connect inputs and outputs
+    return sample.get('connection_vs_depth').astype(float)
+
+
+@observable('rank_entropy', requires=['graph_state'])
+def rank_entropy(sample):
+    # stabilizer entropy of the first N//2 outputs of the state with the inputs in |0>
+    state = sample.get('graph_state')
+    if state is None:
+        return np.nan
+    return state.entropy(np.arange(len(state.qubits) // 2))
+
+
+@observable('rank_entropy_profile', requires=['graph_state'])
+def rank_entropy_profile(sample):
+    # S(l) for contiguous output subsystems of size l = 1..N//2, stored as rank_entropy_profile_<l>
+    state = sample.get('graph_state')
+    sizes = range(1, sample.kwargs['N'] // 2 + 1)
+    if state is None:
+        return {l: np.nan for l in sizes}
+    return dict(zip(sizes, state.entropy_profile(sizes)))
+
+
+@observable('mi', requires=['tableau'])
+def mi(sample):
+    # antipodal mutual information, as "mi" of mi/mi_script.jl
+    return stab.antipodal_mutual_information(sample.get('tableau'))
+
+
+@observable('gate_counts')
+def gate_counts(sample):
+    # number of gates of each kind, stored as gate_counts_<gate>, see reweighting.py
+    return rw.gate_counts(sample.kwargs['string_circuit'])
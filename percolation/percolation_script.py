@@ -1,21 +1,32 @@
 import percolation.util_functions as uf
+import percolation.strategies as st
+import percolation.sparse_graph as sg
+import percolation.observables as obs
+import percolation.records as rec
+import percolation.shards as shards
+import percolation.scheduling as sch
+import percolation.accumulators as acc
+import percolation.microcanonical as mc
+import percolation.telemetry as tel
 import numpy as np
-from tqdm import trange, tqdm
+from tqdm import tqdm
 import argparse
+import time
+import multiprocessing
 from itertools import product
 import os
-from pyzx import full_reduce
-import pandas
 rng = np.random.default_rng()
 
 
-def parse_args():
+def parse_args(argv=None):
     parser = argparse.ArgumentParser(description="Your script description.")
     parser.add_argument("-N", type=int, default=40, help="Value for N")
     parser.add_argument("--t_factor", type=int, default=4,
                         help="Value for t_factor")
     parser.add_argument("--ncores", type=int, default=5,
-                        help="Value for t_factor")
+                        help="number of worker processes, 1 runs everything in this process")
+    parser.add_argument("--chunksize", type=int,
+                        help="tasks handed to a worker at a time (default: a few chunks per worker)")
     parser.add_argument("--niterations", type=int,
                         default=50, help="Number of iterations")
     parser.add_argument("-p", nargs='*', type=float,
@@ -29,29 +40,47 @@ def parse_args():
     parser.add_argument(
         "--save_path", help="path in which to save the data", default="data/test")
     parser.add_argument("--periodic", action='store_true')
-
-    return parser.parse_args()
-
-
-def single_iteration(params):
-    N, t_factor, p, q, r, it, quiet, output_data, save_path, periodic, data_path = params
-    output_dict = uf.general_single_iteration(
-        N, t_factor, run_all_hfunction, quiet=quiet, p=p, q=q, r=r, simp_method=full_reduce, periodic=periodic)
-
-    for key in output_dict:
-        output_data[(p, q, r, key)][it] = output_dict[key]
-
-    # try:
-    to_save = output_data.copy()
-    df = pandas.DataFrame({key: list(to_save[key]) for key in to_save})
-    df.to_csv(f"{save_path}/{data_path}")
-
-    return it, output_dict
+    parser.add_argument("--simp_method", default="full_reduce",
+                        choices=list(st.SIMP_STRATEGIES) + ['auto'],
+                        help="simplification strategy, 'auto' picks it from --strategy_table")
+    parser.add_argument("--strategy_table",
+                        help="strategy table written by calibrate_strategies.py")
+    parser.add_argument("--observables", nargs='*', default=obs.DEFAULT_OBSERVABLES,
+                        choices=list(obs.OBSERVABLES), help="observables to compute and save")
+    parser.add_argument("--check_invariants", action='store_true',
+                        help="check the diagram invariants after removing excess nodes and after simplification")
+    parser.add_argument("--resume", metavar="RECORDS",
+                        help="record stream (dataK.jsonl) of an interrupted run to continue, skipping its samples")
+    parser.add_argument("--target_error", type=float,
+                        help="adaptive sampling: keep adding iterations to the points whose standard error on "
+                             "--target_observables is above this, up to --niterations")
+    parser.add_argument("--target_observables", nargs='*', default=['lc'],
+                        help="scalar observables whose standard error --target_error applies to")
+    parser.add_argument("--min_iterations", type=int, default=10,
+                        help="iterations of every point before the adaptive sampling starts")
+    parser.add_argument("--seed", type=int,
+                        help="entropy of the seeds of all the samples (default: fresh), recorded in the manifest")
+    parser.add_argument("--seed_by_point", action='store_true',
+                        help="seed the samples by their (p, q, r) values instead of their index in the grid, "
+                             "so that extending the grid keeps the samples of the existing points")
+    parser.add_argument("--coupled", action='store_true',
+                        help="threshold the same slot variates at every (p, q, r) of an iteration (common random numbers)")
+    parser.add_argument("--metrics",
+                        help="JSON lines file of throughput, stage shares and ETA snapshots (see telemetry.py)")
+    parser.add_argument("--metrics_interval", type=float, default=30, help="seconds between metrics snapshots")
+    parser.add_argument("--microcanonical", action='store_true',
+                        help="one sweep over the number of measurements per (q, r) and iteration, giving the "
+                             "spacetime cluster observables at every p (ignores --observables)")
+
+    args = parser.parse_args(argv)
+    if args.microcanonical:
+        args.observables = list(mc.SWEEP_OBSERVABLES)
+    return args
 
 
 def add_cnots(string_circuit, p, q, r):
     ngates = np.sum(string_circuit != '')
-    ncnots = np.sum(string_circuit == 'cnot')
+    ncnots = np.sum(np.isin(string_circuit, ['cnot', 'lcnot', 'rcnot']))
     swap_N, swap_t = np.where(string_circuit == 'swap')
     pcnots = (1 - p) * r
 
@@ -71,7 +100,7 @@ def add_measurements(string_circuit, p, q, r):
     pids = p * (1-q)
     pbells = p * q
     unitary_N, unitary_t = np.where(
-        (string_circuit == 'swap') | (string_circuit == 'cnot'))
+        np.isin(string_circuit, ['swap', 'cnot', 'lcnot', 'rcnot']))
     ids_to_add = int(pids * ngates - nids)
     bells_to_add = int(pbells * ngates - nbells)
 
@@ -94,70 +123,295 @@ def add_measurements(string_circuit, p, q, r):
     return string_circuit
 
 
-def run_all_hfunction(G, g, **kwargs):
-    lc, slc = uf.percolation_hfunction(G, g, **kwargs)
-    is_path = uf.find_path_hfunction(G, g, **kwargs)
-    min_cut_if = uf.min_cut_hfunction(G, g, **kwargs)
-    min_cut_ff = uf.min_cut_hfunction(G, g, **kwargs)
-    min_cut_X = uf.min_cut_hfunction(G, g, **kwargs)
-    # min_cut_if -> min_cut for backwards compitability
-    return {'lc': lc, 'slc': slc, 'is_path': is_path, 'min_cut': min_cut_if, 'min_cut_ff': min_cut_ff, 'min_cut_X': min_cut_X}
+# all the observables stored by default, see observables.py
+run_all_hfunction = obs.ObservableEngine(obs.DEFAULT_OBSERVABLES)
 
 
 def get_data_name(path):
-    # Check if 'data.csv' exists
-    if not os.path.isfile(f'{path}/data.csv'):
-        filename = "data.csv"
-    else:
-        # Find the next available 'dataX.csv'
-        i = 1
-        while os.path.isfile(f'{path}/data{i}.csv'):
-            i += 1
-        filename = f"data{i}.csv"
-
-    # Create an empty file with that name to reserve it
-    with open(f'{path}/{filename}', 'w') as file:
-        pass  # This creates an empty file
-
-    return filename
+    # reserves the next free dataK.csv, safely against concurrent launches in the same path
+    return shards.allocate_shard(path)
+
+
+def get_simp_method(args, p, q, r, strategy_table=None):
+    if args.simp_method != 'auto':
+        return st.get_strategy(args.simp_method)
+    return st.get_strategy(st.choose_strategy(strategy_table, args.N, p, q, r))
+
+
+### WORKERS
+
+# state kept by every worker process between its tasks, see init_worker
+_worker = {}
+
+
+def init_worker(runs, strategy_table):
+    # runs once per worker, which then keeps its imports, engines and tables for all of its tasks.
+    # runs: N -> (args, entropy) of the shards whose tasks the pool runs
+    # the circuits aren't built from cached templates: copying the empty diagram of a size is as
+    # slow as building it again (a few ms, against tens for placing its gates)
+    _worker['strategy_table'] = strategy_table
+    _worker['runs'] = {N: (args, entropy, make_hfunction(args)) for N, (args, entropy) in runs.items()}
+
+
+def make_hfunction(args):
+    if args.microcanonical:
+        # sweeps compute their observables themselves, see run_sweep_task
+        return None
+    # the gate counts are always stored, so that the samples can be reweighted later on
+    return obs.ObservableEngine(
+        args.observables + [name for name in ['gate_counts'] if name not in args.observables])
+
+
+def make_tasks(args, completed=(), wanted=None):
+    """(N, iteration, points, seed key) tasks giving every point its `wanted` iterations (by
+    default --niterations), without the (p, q, r, iteration) keys in `completed`.
+    Coupled points share the variates of their iteration, so they are one task, otherwise
+    every point is a task of its own, see shards.seed_layout for the seeds."""
+    completed = set(completed)
+    all_points = list(product(args.p, args.q, args.r))
+    if wanted is None:
+        wanted = dict.fromkeys(all_points, args.niterations)
+    tasks = []
+    for it in range(max(wanted.values(), default=0)):
+        points = [(ipoint, point) for ipoint, point in enumerate(all_points)
+                  if it < wanted.get(point, 0) and point + (it,) not in completed]
+        if args.microcanonical:
+            # one sweep per (q, r) gives all of its p at once
+            for iqr, (q, r) in enumerate(product(args.q, args.r)):
+                sweep_points = [point for _, point in points if point[1:] == (q, r)]
+                if sweep_points:
+                    tasks.append((args.N, it, sweep_points, (args.N, it, *point_seed_key((q, r)))
+                                  if args.seed_by_point else (args.N, it, iqr)))
+        elif args.coupled and points:
+            tasks.append((args.N, it, [point for _, point in points], (args.N, it)))
+        elif not args.coupled:
+            tasks.extend((args.N, it, [point],
+                          (args.N, it, *point_seed_key(point)) if args.seed_by_point else (args.N, it, ipoint))
+                         for ipoint, point in points)
+    return tasks
+
+
+def point_seed_key(point):
+    # SeedSequence takes non-negative integers, the values are kept to 10 digits
+    return tuple(int(round(x * 10 ** 10)) for x in point)
+
+
+def run_task(task):
+    N, it, points, seed_key = task
+    args, entropy, hfunction = _worker['runs'][N]
+    if args.microcanonical:
+        return N, run_sweep_task(args, it, points, np.random.default_rng([entropy, *seed_key]))
+    # seeded per task, so that a sample doesn't depend on the worker or the order it runs in
+    uf.rng = np.random.default_rng([entropy, *seed_key])
+    if args.coupled:
+        variates = uf.sample_slot_variates(args.N, args.t_factor)
+    results = []
+    for p, q, r in points:
+        simp_method = get_simp_method(args, p, q, r, _worker['strategy_table'])
+        circuit_kwargs = {}
+        if args.coupled:
+            circuit_kwargs['string_circuit'] = uf.threshold_string_circuit(
+                *variates, p, q, r, args.periodic)
+
+        timings = {}
+        output_dict = uf.general_single_iteration(
+            args.N, args.t_factor, hfunction, quiet=args.quiet, p=p, q=q, r=r, simp_method=simp_method,
+            periodic=args.periodic, check_invariants=args.check_invariants, to_graph=sg.pyzx_to_csr,
+            timings=timings, **circuit_kwargs)
+        results.append((it, (p, q, r), output_dict, timings))
+    return N, results
+
+
+def run_sweep_task(args, it, points, rng):
+    # the points of one (q, r), with the values of one sweep at every p from its binomial average
+    mc.rng = rng
+    _, q, r = points[0]
+    start = time.perf_counter()
+    sweep = mc.Sweep(args.N, args.t_factor, q, r, args.periodic)
+    sampled = time.perf_counter()
+    sweep_data = mc.sweep_observables(sweep)
+    ps = [p for p, _, _ in points]
+    values = {key: mc.canonical(sweep_data[key], sweep.nslots, ps) for key in mc.SWEEP_OBSERVABLES}
+    # the time of the sweep is shared by its points
+    timings = {'sample': (sampled - start) / len(points),
+               'observables': (time.perf_counter() - sampled) / len(points)}
+    return [(it, point, {key: values[key][i] for key in values}, dict(timings))
+            for i, point in enumerate(points)]
+
+
+def load_strategy_table(args):
+    if args.simp_method != 'auto':
+        return None
+    if args.strategy_table is None:
+        raise Exception("--simp_method auto requires a --strategy_table")
+    return st.load_strategy_table(args.strategy_table)
+
+
+class ShardRun(object):
+    """One shard of samples: every sample is appended to dataK.jsonl as it arrives, dataK.csv is
+    written at the end and dataK.manifest.json records the arguments and the seeds of the shard.
+    The (p, q, r, iteration) keys in `done` are samples stored elsewhere, which are not run again."""
+
+    def __init__(self, args, done=()):
+        self.args = args
+        if args.resume:
+            self.records_path = args.resume
+            manifest = shards.load_manifest(self.records_path)
+            if manifest.get('seed_keys') != shards.seed_layout(args):
+                raise Exception(f"{self.records_path} was seeded by {manifest.get('seed_keys')}, "
+                                f"not {shards.seed_layout(args)}, its samples can't be continued")
+            # the samples of one shard have the same circuits, engine and observable columns
+            mismatched = shards.mismatched_args(manifest['args'], args)
+            if set(manifest['args']['observables']) != set(args.observables):
+                mismatched.append('observables')
+            if mismatched:
+                name = mismatched[0]
+                raise Exception(f"{self.records_path} was run with --{name} {manifest['args'].get(name)}, "
+                                f"not {getattr(args, name)}, its samples can't be continued")
+            if args.seed is not None and args.seed != manifest['entropy']:
+                raise Exception(f"{self.records_path} was seeded with {manifest['entropy']}, not --seed {args.seed}")
+            self.entropy = manifest['entropy']
+        else:
+            self.records_path = f"{args.save_path}/{os.path.splitext(get_data_name(args.save_path))[0]}.jsonl"
+            self.entropy = args.seed if args.seed is not None else np.random.SeedSequence().entropy
+            shards.write_manifest(self.records_path, args, self.entropy)
+        self.data_path = os.path.splitext(self.records_path)[0] + '.csv'
+        if args.target_error is not None:
+            missing = [name for name in args.target_observables if name not in args.observables]
+            if missing:
+                raise Exception(f"--target_observables {missing} are not in --observables")
+
+        self.tables = rec.ResultTables(args.niterations)
+        self.stats = acc.RunningStats()
+        records = [record for record in rec.load_records(self.records_path) if record['it'] < args.niterations]
+        for record in records:
+            self.tables.add_record(record)
+            self._add_stats((record['p'], record['q'], record['r']), record['values'])
+        self.completed = rec.completed_keys(records) | set(done)
+        if records:
+            print(f"resuming {self.records_path}: {len(records)} samples done")
+
+        self.points = list(product(args.p, args.q, args.r))
+        if args.target_error is None:
+            self.wanted = dict.fromkeys(self.points, args.niterations)
+        else:
+            # a resumed run picks up where the samples it already has left it
+            done = {point: sum(point + (it,) in self.completed for it in range(args.niterations))
+                    for point in self.points}
+            self.wanted = {point: min(max(args.min_iterations, done[point]), args.niterations)
+                           for point in self.points}
+        self.writer = rec.RecordWriter(self.records_path)
+
+    def _add_stats(self, point, output_dict):
+        for name in self.args.target_observables:
+            if name in output_dict:
+                self.stats.add((self.args.N, *point), name, output_dict[name])
+
+    def tasks(self):
+        return make_tasks(self.args, self.completed, self.wanted)
+
+    def collect(self, task_results):
+        for it, point, output_dict, timings in task_results:
+            self.tables.add(self.args.N, it, point, output_dict)
+            self.writer.write(rec.make_record(self.args.N, it, point, output_dict, timings))
+            self.completed.add(point + (it,))
+            self._add_stats(point, output_dict)
+
+    def next_round(self):
+        """Whether adaptive sampling (--target_error) asks for another round of tasks."""
+        if self.args.target_error is None:
+            return False
+        wanted = sch.adaptive_round(self.stats, self.args.N, self.wanted, self.args.target_observables,
+                                    self.args.target_error, self.args.min_iterations, self.args.niterations)
+        changed = wanted != self.wanted
+        self.wanted = wanted
+        return changed
+
+    def close(self):
+        self.writer.close()
+
+    def finish(self):
+        self.tables.save(self.data_path, rec.streamed_path(self.data_path))
+        shards.finish_manifest(self.records_path)
+        if self.args.target_error is not None:
+            print(f"adaptive sampling used {sum(self.wanted.values())} of "
+                  f"{len(self.points) * self.args.niterations} samples: "
+                  + ", ".join(f"{point}: {n}" for point, n in self.wanted.items()))
+
+
+def make_telemetry(args):
+    if args.metrics is None:
+        return None
+    return tel.Telemetry(args.metrics, args.metrics_interval)
+
+
+def run_shards(runs, ncores, chunksize=None, strategy_table=None, task_cost=None, telemetry=None):
+    """Runs the tasks of all the shards on one pool of ncores workers, in rounds while adaptive
+    sampling asks for more. With a task_cost, the tasks are handed out one at a time, most
+    expensive first (LPT, see scheduling.lpt_order), so that the small ones fill the gaps.
+    A Telemetry gets every sample and the number of tasks left in the round."""
+    by_N = {run.args.N: run for run in runs}
+    if len(by_N) < len(runs):
+        raise Exception("the shards run together need different N")
+    initargs = ({N: (run.args, run.entropy) for N, run in by_N.items()}, strategy_table)
+
+    pool = None
+    try:
+        if ncores > 1:
+            # spawn gives the same behaviour on every platform, the workers import this module
+            # without running it (see the __main__ guard)
+            pool = multiprocessing.get_context('spawn').Pool(
+                ncores, initializer=init_worker, initargs=initargs)
+        else:
+            init_worker(*initargs)
+
+        while True:
+            tasks = [task for run in runs for task in run.tasks()]
+            if tasks:
+                if task_cost is not None:
+                    tasks = sch.lpt_order(tasks, task_cost)
+                    size = 1
+                else:
+                    size = chunksize or max(1, len(tasks) // (4 * ncores))
+                if telemetry is not None:
+                    telemetry.set_queue_depth(len(tasks))
+                if pool is not None:
+                    results = pool.imap_unordered(run_task, tasks, chunksize=size)
+                else:
+                    results = map(run_task, tasks)
+                # all the results are gathered here, in the main process, in whatever order they finish
+                for ndone, (N, task_results) in enumerate(tqdm(results, total=len(tasks)), 1):
+                    by_N[N].collect(task_results)
+                    if telemetry is not None:
+                        for _, point, _, timings in task_results:
+                            telemetry.add(N, point[0], timings)
+                        telemetry.task_done(len(tasks) - ndone)
+            # every shard decides on its next round, so no short-circuiting any()
+            if not any([run.next_round() for run in runs]):
+                break
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        for run in runs:
+            run.close()
+        if telemetry is not None:
+            telemetry.close()
+    for run in runs:
+        run.finish()
 
 
 def run_percolation(args):
-    output_data = {}
-    data_name = get_data_name(args.save_path)
-
-    lp, lq, lr = len(args.p), len(args.q), len(args.r)
-    icombinations = product(range(lp), range(
-        lq), range(lr))
-
-    for ip, iq, ir in icombinations:
-        p, q, r = args.p[ip], args.q[iq], args.r[ir]
-        for key in ['lc', 'slc', 'is_path', 'min_cut', 'min_cut_ff', 'min_cut_X']:
-            output_data[(p, q, r, key)] = [
-                np.nan for _ in range(args.niterations)]
-
-    for it in trange(args.niterations):
-        icombinations = product(range(lp), range(
-            lq), range(lr))
-
-        for ip, iq, ir in tqdm(icombinations, leave=False, total=lp * lq * lr):
-            p, q, r = args.p[ip], args.q[iq], args.r[ir]
-
-            output_dict = uf.general_single_iteration(
-                args.N, args.t_factor, run_all_hfunction, quiet=args.quiet, p=p, q=q, r=r, simp_method=full_reduce, periodic=args.periodic)
-            for key in output_dict:
-                output_data[(p, q, r, key)][it] = output_dict[key]
-
-        df = pandas.DataFrame(
-            {key: list(output_data[key]) for key in output_data})
-        df.to_csv(f"{args.save_path}/{data_name}")
+    strategy_table = load_strategy_table(args)
+    run_shards([ShardRun(args)], args.ncores, args.chunksize, strategy_table, telemetry=make_telemetry(args))
 
 
-args = parse_args()
-args.p.sort()
-args.q.sort()
-args.r.sort()
+if __name__ == "__main__":
+    args = parse_args()
+    args.p.sort()
+    args.q.sort()
+    args.r.sort()
 
-os.makedirs(args.save_path, exist_ok=True)
-run_percolation(args)
-print(f"run is done. args were: {args}")
+    os.makedirs(args.save_path, exist_ok=True)
+    run_percolation(args)
+    print(f"run is done. args were: {args}")
@@ -0,0 +1,174 @@
+import json
+import os
+import queue
+import threading
+import numpy as np
+import pandas
+import argparse
+import percolation.observables as obs
+import percolation.accumulators as acc
+
+
+def _to_json(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"can't store {type(value)} in a record")
+
+
+def record_line(record):
+    return json.dumps(record, default=_to_json) + '\n'
+
+
+def make_record(N, it, point, output_dict, timings=None):
+    # timings: seconds per stage of the sample, the telemetry of scheduling.fit_cost_model
+    p, q, r = point
+    record = {'N': N, 'it': int(it), 'p': p, 'q': q, 'r': r, 'values': output_dict}
+    if timings:
+        record['timings'] = timings
+    return record
+
+
+def record_key(record):
+    return record['p'], record['q'], record['r'], record['it']
+
+
+class RecordWriter(object):
+    """Appends one JSON line per sample to `path` from a background thread.
+
+    Records are written in batches of up to `batch_size`, or whatever arrived within
+    `flush_interval` seconds, and every batch is flushed to disk. The file is only ever
+    appended to, so a crash loses at most the last batch and a partial last line, which
+    load_records skips."""
+
+    def __init__(self, path, batch_size=64, flush_interval=10):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue()
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def write(self, record):
+        if self.error is not None:
+            raise self.error
+        self.queue.put(record)
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def _run(self):
+        done = False
+        try:
+            file = open(self.path, 'a+')
+            file.seek(0, os.SEEK_END)
+            if file.tell() > 0:
+                file.seek(file.tell() - 1)
+                if file.read(1) != '\n':
+                    # an interrupted write left a partial line, start after it
+                    file.write('\n')
+        except Exception as e:
+            self.error = e
+            return
+        with file:
+            while not done:
+                batch = []
+                try:
+                    batch.append(self.queue.get(timeout=self.flush_interval))
+                    while len(batch) < self.batch_size:
+                        batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    pass
+                if batch and batch[-1] is None:
+                    batch.pop()
+                    done = True
+                if not batch:
+                    continue
+                try:
+                    file.write(''.join(record_line(record) for record in batch))
+                    file.flush()
+                    os.fsync(file.fileno())
+                except Exception as e:
+                    self.error = e
+                    return
+
+
+def load_records(path):
+    records = []
+    if not os.path.isfile(path):
+        return records
+    with open(path) as file:
+        for line in file:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                # the partial line of an interrupted write
+                continue
+    return records
+
+
+def completed_keys(records):
+    return {record_key(record) for record in records}
+
+
+class ResultTables(object):
+    """The wide per-sample table of percolation_script.py (one column per (p, q, r, key), one
+    row per iteration) and the sums of the streamed observables, filled sample by sample."""
+
+    def __init__(self, niterations):
+        self.niterations = niterations
+        self.output_data = {}
+        self.streamed = acc.StreamedSums()
+
+    def add(self, N, it, point, output_dict):
+        p, q, r = point
+        for key in output_dict:
+            if key in obs.STREAMED_OBSERVABLES:
+                self.streamed.add((N, p, q, r), key, output_dict[key])
+                continue
+            # columns are created by the first sample, since vector observables add several
+            self.output_data.setdefault((p, q, r, key), [
+                np.nan for _ in range(self.niterations)])[it] = output_dict[key]
+
+    def add_record(self, record):
+        self.add(record['N'], record['it'], (record['p'], record['q'], record['r']), record['values'])
+
+    def save(self, path, streamed_path):
+        # samples arrive in any order, the columns are ordered by point as in a serial run
+        keys = sorted(self.output_data, key=lambda key: key[:3])
+        df = pandas.DataFrame({key: list(self.output_data[key]) for key in keys})
+        df.to_csv(path)
+        if self.streamed.sums:
+            self.streamed.save(streamed_path)
+
+
+def streamed_path(path):
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f"streamed_{name}")
+
+
+def export_records(records_path, niterations=None):
+    """Writes the csv files of a record stream next to it, e.g. data3.jsonl -> data3.csv."""
+    records = load_records(records_path)
+    if niterations is None:
+        niterations = max((record['it'] for record in records), default=-1) + 1
+    tables = ResultTables(niterations)
+    for record in records:
+        tables.add_record(record)
+    path = os.path.splitext(records_path)[0] + '.csv'
+    tables.save(path, streamed_path(path))
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a record stream to the csv files of percolation_script.py.")
+    parser.add_argument("records", nargs='+', help="jsonl record streams")
+    parser.add_argument("--niterations", type=int, help="number of rows (default: the last iteration found)")
+    args = parser.parse_args()
+    for path in args.records:
+        print(f"{path} -> {export_records(path, args.niterations)}")
@@ -0,0 +1,89 @@
+import argparse
+import os
+from itertools import product
+import numpy as np
+import pandas
+import percolation.percolation_script as script
+import percolation.records as rec
+import percolation.shards as shards
+import percolation.accumulators as acc
+import percolation.scheduling as sch
+
+
+def load_stats(save_path, Ns, observable):
+    """Running statistics of `observable` per (N, p, q, r) over all the shards of save_path/N<N>."""
+    stats = acc.RunningStats()
+    for N in Ns:
+        for records_path in shards.find_shards([os.path.join(save_path, f"N{N}")]):
+            for record in rec.load_records(records_path):
+                if observable in record['values']:
+                    stats.add((N, record['p'], record['q'], record['r']), observable, record['values'][observable])
+    return stats
+
+
+def find_crossings(stats, Ns, ps, qs, rs, observable):
+    """crossing_brackets of every (q, r), as rows (q, r, N1, N2, p1, p2, p_cross)."""
+    crossings = []
+    for q, r in product(qs, rs):
+        curves = {N: [stats.mean((N, p, q, r), observable) for p in ps] for N in Ns}
+        crossings.extend((q, r) + bracket for bracket in sch.crossing_brackets(ps, curves))
+    return crossings
+
+
+def round_arguments(save_path, N, ps, script_argv):
+    """percolation_script.py arguments of the p-points `ps` of a round for size N."""
+    # every round numbers its own p-points from 0, so seeds by point index would repeat across rounds
+    run_args = script.parse_args(script_argv + [
+        '-N', str(N), '--save_path', os.path.join(save_path, f"N{N}"), '-p', *map(str, ps), '--seed_by_point'])
+    run_args.p.sort()
+    run_args.q.sort()
+    run_args.r.sort()
+    return run_args
+
+
+def refine(args, script_argv):
+    """Runs percolation_script.py for every N on the coarse grid, then on new p-points in the
+    intervals where the curves of consecutive N cross, until these intervals are no wider than
+    args.resolution. Every round is a new shard of save_path/N<N>."""
+    ps = np.round(np.linspace(args.p_min, args.p_max, args.ncoarse), 10).tolist()
+    new_ps = ps
+    crossings = []
+    for round_ in range(args.max_rounds):
+        print(f"round {round_}: p = {new_ps}")
+        for N in args.N:
+            run_args = round_arguments(args.save_path, N, new_ps, script_argv)
+            os.makedirs(run_args.save_path, exist_ok=True)
+            script.run_percolation(run_args)
+
+        stats = load_stats(args.save_path, args.N, args.observable)
+        crossings = find_crossings(stats, sorted(args.N), ps, run_args.q, run_args.r, args.observable)
+        if not crossings:
+            print(f"the {args.observable} curves don't cross in [{args.p_min}, {args.p_max}]")
+        new_ps = [p for p in sch.refine_points([c[2:] for c in crossings], args.resolution, args.npoints)
+                  if p not in ps]
+        if not new_ps:
+            break
+        ps = sorted(ps + new_ps)
+    return pandas.DataFrame(crossings, columns=['q', 'r', 'N1', 'N2', 'p1', 'p2', 'p_cross'])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run percolation_script.py on a coarse p-grid and refine it where the curves of "
+                    "different N cross. Arguments not listed here are passed on to percolation_script.py.")
+    parser.add_argument("-N", nargs='+', type=int, required=True, help="system sizes")
+    parser.add_argument("--p_min", type=float, default=0.15)
+    parser.add_argument("--p_max", type=float, default=0.4)
+    parser.add_argument("--ncoarse", type=int, default=6, help="number of p-points of the coarse grid")
+    parser.add_argument("--observable", default='is_path', help="scalar observable whose crossings are refined")
+    parser.add_argument("--resolution", type=float, default=0.005,
+                        help="stop once every crossing is bracketed by an interval at most this wide")
+    parser.add_argument("--npoints", type=int, default=1, help="new p-points per bracketing interval and round")
+    parser.add_argument("--max_rounds", type=int, default=10)
+    parser.add_argument("--save_path", default="data/test", help="path in which to save the data, in N<N>/")
+    args, script_argv = parser.parse_known_args()
+
+    crossings = refine(args, script_argv)
+    os.makedirs(args.save_path, exist_ok=True)
+    crossings.to_csv(os.path.join(args.save_path, "crossings.csv"), index=False)
+    print(crossings)
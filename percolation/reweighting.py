@@ -0,0 +1,114 @@
+import numpy as np
+import pandas
+import argparse
+
+# gate categories in the order of lprobs in util_functions.sample_string_circuit; the cnot
+# orientation is a fair coin whatever the parameters, so it doesn't enter the likelihood
+GATE_CATEGORIES = ['swap', 'cnot', 'id_projection', 'bell_projection']
+GATE_NAMES = {'swap': 'swap', 'cnot': 'cnot', 'lcnot': 'cnot', 'rcnot': 'cnot',
+              'id_projection': 'id_projection', 'bell_projection': 'bell_projection'}
+COUNT_COLUMNS = [f"gate_counts_{c}" for c in GATE_CATEGORIES]
+
+
+def gate_counts(string_circuit):
+    names, counts = np.unique(np.asarray(string_circuit), return_counts=True)
+    output = dict.fromkeys(GATE_CATEGORIES, 0)
+    for name, count in zip(names.tolist(), counts.tolist()):
+        if name in GATE_NAMES:
+            output[GATE_NAMES[name]] += count
+    return output
+
+
+def gate_probabilities(p, q, r):
+    return np.array([(1-p) * (1-r), (1-p) * r, p * (1 - q), p * q])
+
+
+def log_weights(counts, source, target):
+    """log of the likelihood ratio target / source of circuits with the given (n, 4) gate
+    counts: every slot is an independent draw, so it only depends on the counts."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.log(gate_probabilities(*target)) - np.log(gate_probabilities(*source))
+    counts = np.asarray(counts, dtype=float)
+    # categories absent from the sample don't constrain it, even if their probability is 0
+    return np.where(counts > 0, counts * ratio, 0).sum(axis=1)
+
+
+def reweight(values, counts, source, target):
+    """Mean of `values` at `target` = (p, q, r) from samples taken at `source`, its error and
+    the effective sample size (sum w)^2 / sum w^2 of the weights, which drops quickly
+    away from the source point."""
+    values = np.asarray(values, dtype=float)
+    lw = log_weights(counts, source, target)
+    if not np.isfinite(lw).any():
+        return np.nan, np.nan, 0.0
+    w = np.exp(lw - lw[np.isfinite(lw)].max())
+    w /= w.sum()
+    mean = np.sum(w * values)
+    ess = 1 / np.sum(w ** 2)
+    error = np.sqrt(np.sum(w * (values - mean) ** 2) / ess)
+    return mean, error, ess
+
+
+def load_samples(paths, source):
+    """Samples of the data csv files of percolation_script.py taken at `source` = (p, q, r),
+    as a DataFrame with one row per sample and one column per observable."""
+    samples = []
+    for path in paths:
+        df = pandas.read_csv(path, header=[0, 1, 2, 3], index_col=0)
+        df.columns.names = ["p", "q", "r", "kind"]
+        point = [all(np.isclose(float(c), s) for c, s in zip(column[:3], source))
+                 for column in df.columns]
+        df = df.loc[:, point]
+        df.columns = df.columns.get_level_values("kind")
+        samples.append(df)
+    samples = pandas.concat(samples, ignore_index=True)
+    missing = [c for c in COUNT_COLUMNS if c not in samples.columns]
+    if missing:
+        raise ValueError(f"no gate counts at {source} (missing {missing}), they are stored since "
+                         f"the gate_counts observable was added")
+    return samples.dropna(subset=COUNT_COLUMNS)
+
+
+def reweight_grid(samples, source, targets, observables=None):
+    if observables is None:
+        observables = [c for c in samples.columns if c not in COUNT_COLUMNS]
+    counts = samples[COUNT_COLUMNS].to_numpy()
+    rows = []
+    for target in targets:
+        for name in observables:
+            values = pandas.to_numeric(samples[name], errors='coerce').to_numpy(dtype=float)
+            valid = ~np.isnan(values)
+            data, error, ess = reweight(values[valid], counts[valid], source, target)
+            rows.append({'p': target[0], 'q': target[1], 'r': target[2], 'kind': name,
+                         'data': data, 'error': error, 'ess': ess, 'nit': valid.sum()})
+    return pandas.DataFrame(rows)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Reweight the samples taken at one (p, q, r) to nearby points using their gate counts.")
+    parser.add_argument("paths", nargs='+', help="data csv files written by percolation_script.py")
+    parser.add_argument("--source", nargs=3, type=float, required=True, metavar=("p", "q", "r"),
+                        help="the point at which the samples were taken")
+    parser.add_argument("-p", nargs='*', type=float, help="target p values (default: the source p)")
+    parser.add_argument("-q", nargs='*', type=float, help="target q values (default: the source q)")
+    parser.add_argument("-r", nargs='*', type=float, help="target r values (default: the source r)")
+    parser.add_argument("--observables", nargs='*', help="observables to reweight (default: all)")
+    parser.add_argument("--min_ess", type=float, default=0,
+                        help="drop the points whose effective sample size is below this")
+    parser.add_argument("--output", default="reweighted.csv")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    source = tuple(args.source)
+    ps, qs, rs = [args.p or [source[0]], args.q or [source[1]], args.r or [source[2]]]
+    targets = [(p, q, r) for p in ps for q in qs for r in rs]
+
+    samples = load_samples(args.paths, source)
+    df = reweight_grid(samples, source, targets, args.observables)
+    df = df[df['ess'] >= args.min_ess]
+    df.to_csv(args.output, index=False)
+    print(df.groupby(['p', 'q', 'r'])['ess'].first())
+    print(f"reweighting is done. args were: {args}")
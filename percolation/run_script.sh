@@ -9,7 +9,7 @@ cp $0 "${script_dir}/${run_path}/."
 
 for N in $(julia -e 'println(join(unique(convert.(Int, 10.0 .^ (1.1:(3.5-1.1)/20:3.5) .÷ 12 .* 12))," "))')
 do
-    ./percolation_script.py -N ${N} --t_factor 4 --niterations 500 --save_path "${run_path}/N${N}" --quiet --periodic -q 0.5 \
+    ./percolation_script.py -N ${N} --t_factor 4 --niterations 500 --save_path "${run_path}/N${N}" --quiet --periodic -q 0.5 --ncores $(nproc) \
             -r 0.1 0.5 0.8 \
-            -p $(julia -e 'println(join(round.(0.15:(0.4-0.15)/20:0.4, sigdigits=10), " "))') &
+            -p $(julia -e 'println(join(round.(0.15:(0.4-0.15)/20:0.4, sigdigits=10), " "))')
 done
\ No newline at end of file
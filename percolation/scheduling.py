@@ -0,0 +1,128 @@
+import heapq
+import numpy as np
+
+
+def adaptive_iterations(stats, key, names, n, target_error, min_iterations, max_iterations):
+    """Number of iterations to have at one point, given its `n` samples so far: enough for the
+    standard errors of `names` to reach `target_error` according to their current variances,
+    growing by at most a factor 2 per round since those variances are themselves noisy."""
+    if n < min_iterations:
+        return min(min_iterations, max_iterations)
+    required = n
+    for name in names:
+        var = stats.var(key, name)
+        if np.isnan(var):
+            # not enough valid samples yet
+            required = max(required, n + 1)
+        elif np.sqrt(var / max(stats.count(key, name), 1)) > target_error:
+            required = max(required, int(np.ceil(var / target_error ** 2)))
+    return int(min(max_iterations, max(n, min(required, 2 * n))))
+
+
+def adaptive_round(stats, N, wanted, names, target_error, min_iterations, max_iterations):
+    """Next `wanted` iterations per (p, q, r), see adaptive_iterations."""
+    return {point: adaptive_iterations(stats, (N, *point), names, n, target_error,
+                                       min_iterations, max_iterations)
+            for point, n in wanted.items()}
+
+
+### GRID REFINEMENT
+
+def crossing_brackets(ps, curves):
+    """Intervals [p_i, p_i+1] of the sorted grid `ps` in which the curves (N -> values at ps)
+    of consecutive sizes cross, i.e. their difference changes sign. Returns (N1, N2, p_i, p_i+1,
+    p_cross) with p_cross the linear interpolation of the crossing."""
+    brackets = []
+    sizes = sorted(curves)
+    for N1, N2 in zip(sizes[:-1], sizes[1:]):
+        difference = np.asarray(curves[N2], dtype=float) - np.asarray(curves[N1], dtype=float)
+        for i in range(len(ps) - 1):
+            d1, d2 = difference[i], difference[i + 1]
+            if np.isnan(d1) or np.isnan(d2) or d1 * d2 > 0 or (d1 == 0 and d2 == 0):
+                continue
+            p_cross = ps[i] + (ps[i + 1] - ps[i]) * d1 / (d1 - d2)
+            brackets.append((N1, N2, ps[i], ps[i + 1], p_cross))
+    return brackets
+
+
+def refine_points(brackets, resolution, npoints=1):
+    """New p-points splitting every bracket wider than `resolution` in npoints + 1 intervals."""
+    points = set()
+    for _, _, p1, p2, _ in brackets:
+        if p2 - p1 > resolution:
+            points.update(round(p1 + (p2 - p1) * k / (npoints + 1), 10) for k in range(1, npoints + 1))
+    return sorted(points)
+
+
+### COST MODEL
+
+STAGES = ['sample', 'simplify', 'observables']
+
+
+class CostModel(object):
+    """Seconds per sample of every stage, fitted as log(t) = a + b log(N) + c p + d q + e r
+    (a power of N whose exponent drifts with the gate probabilities), for the t_factor of the
+    data it was fitted on."""
+
+    def __init__(self, coefficients):
+        # stage -> (a, b, c, d, e)
+        self.coefficients = coefficients
+
+    @staticmethod
+    def features(N, p, q, r):
+        return np.array([np.ones_like(np.asarray(N, dtype=float)), np.log(N), p, q, r], dtype=float)
+
+    def stage_cost(self, stage, N, p, q, r):
+        return float(np.exp(self.coefficients[stage] @ self.features(N, p, q, r)))
+
+    def cost(self, N, p, q, r):
+        return sum(self.stage_cost(stage, N, p, q, r) for stage in self.coefficients)
+
+    def task_cost(self, task):
+        N, _, points, _ = task
+        return sum(self.cost(N, *point) for point in points)
+
+
+def fit_cost_model(timings):
+    """Least squares fit of CostModel to a table with columns N, p, q, r and one column of
+    seconds per stage (rows missing a stage are left out of its fit). The gate probabilities
+    which are the same in all the rows are left out of the fit (the cost doesn't depend on
+    them), but the timings need at least two N to extrapolate to the others."""
+    coefficients = {}
+    for stage in STAGES:
+        if stage not in timings:
+            continue
+        rows = timings[['N', 'p', 'q', 'r', stage]].dropna()
+        rows = rows[rows[stage] > 0]
+        if rows.empty:
+            continue
+        if rows['N'].nunique() < 2:
+            raise ValueError(f"the {stage} timings only have N = {rows['N'].iloc[0]}, "
+                             f"fitting the cost of other sizes needs timings of at least two")
+        X = CostModel.features(rows['N'], rows['p'], rows['q'], rows['r']).T
+        # constant features can't be told apart from the intercept a
+        varying = np.ptp(X, axis=0) > 0
+        varying[0] = True
+        solution, _, rank, _ = np.linalg.lstsq(X[:, varying], np.log(rows[stage].to_numpy()), rcond=None)
+        if rank < varying.sum():
+            raise ValueError(f"the {stage} timings don't determine the cost model: the rank of its "
+                             f"{varying.sum()} features is {rank}")
+        coefficients[stage] = np.zeros(X.shape[1])
+        coefficients[stage][varying] = solution
+    if not coefficients:
+        raise ValueError("no timings to fit a cost model to")
+    return CostModel(coefficients)
+
+
+def lpt_order(tasks, cost):
+    """Tasks sorted longest first: handed to a pool one at a time, every worker takes the
+    longest task left when it becomes free, which is the LPT rule."""
+    return sorted(tasks, key=cost, reverse=True)
+
+
+def lpt_makespan(costs, ncores):
+    """Wall time of the LPT schedule of tasks with these costs on ncores workers."""
+    loads = [0.0] * ncores
+    for cost in sorted(costs, reverse=True):
+        heapq.heapreplace(loads, loads[0] + cost)
+    return max(loads)
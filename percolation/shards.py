@@ -0,0 +1,156 @@
+import argparse
+import json
+import os
+import socket
+import sys
+import time
+from glob import glob
+import pandas
+import percolation.records as rec
+
+MANIFEST_SUFFIX = '.manifest.json'
+
+
+def allocate_shard(path, prefix='data', suffix='.csv'):
+    """Reserves the next free name data.csv, data1.csv, ... in `path` by creating it with
+    O_EXCL, which fails if the file already exists, so concurrent launches into the same
+    directory never get the same shard. Returns the name."""
+    i = len(glob(os.path.join(path, f"{prefix}*{suffix}")))
+    while True:
+        name = f"{prefix}{i if i else ''}{suffix}"
+        try:
+            fd = os.open(os.path.join(path, name), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            i += 1
+            continue
+        os.close(fd)
+        return name
+
+
+def manifest_path(records_path):
+    return os.path.splitext(records_path)[0] + MANIFEST_SUFFIX
+
+
+def _write_json(path, content):
+    # written aside and renamed, so a manifest is never seen half written
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as file:
+        json.dump(content, file, indent=1)
+    os.replace(tmp_path, path)
+
+
+def seed_layout(args):
+    """What the seed of a sample is made of, after the entropy. Sample (iteration, point index)
+    of size N is drawn with SeedSequence([entropy, N, iteration, index]), where index counts the
+    (p, q, r) of product(p, q, r), or SeedSequence([entropy, N, iteration, *point_seed_key((p, q, r))])
+    with --seed_by_point; coupled iterations use SeedSequence([entropy, N, iteration]) and the
+    microcanonical sweeps SeedSequence([entropy, N, iteration, index of (q, r)]) (or its values
+    with --seed_by_point). N is part of the seed so that the sizes of a sweep sharing one
+    --seed are independent."""
+    if getattr(args, 'microcanonical', False):
+        return ['N', 'iteration', 'q', 'r'] if getattr(args, 'seed_by_point', False) else ['N', 'iteration', 'qr']
+    if args.coupled:
+        return ['N', 'iteration']
+    if getattr(args, 'seed_by_point', False):
+        return ['N', 'iteration', 'p', 'q', 'r']
+    return ['N', 'iteration', 'point']
+
+
+# the arguments of a stored sample which have to be those of a run for it to be reused or continued:
+# those of its circuit, and those of the graph its observables are computed on
+MATCHING_ARGS = ['N', 't_factor', 'periodic', 'coupled', 'seed_by_point', 'microcanonical',
+                 'simp_method', 'strategy_table']
+
+
+def mismatched_args(stored_args, args):
+    """The MATCHING_ARGS in which the arguments of a manifest differ from args."""
+    return [name for name in MATCHING_ARGS if stored_args.get(name) != getattr(args, name)]
+
+
+def write_manifest(records_path, args, entropy):
+    """Manifest of a shard: its arguments, where its samples go and how their seeds are made
+    (see seed_layout)."""
+    seed_keys = seed_layout(args)
+    manifest = {
+        'records': os.path.basename(records_path),
+        'args': vars(args),
+        'entropy': entropy,
+        'seed_keys': seed_keys,
+        'iterations': [0, args.niterations],
+        'host': socket.gethostname(),
+        'pid': os.getpid(),
+        'command': sys.argv,
+        'started': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'finished': None,
+    }
+    _write_json(manifest_path(records_path), manifest)
+    return manifest
+
+
+def load_manifest(records_path):
+    with open(manifest_path(records_path)) as file:
+        return json.load(file)
+
+
+def finish_manifest(records_path):
+    manifest = load_manifest(records_path)
+    manifest['finished'] = time.strftime('%Y-%m-%d %H:%M:%S')
+    _write_json(manifest_path(records_path), manifest)
+
+
+def find_shards(paths):
+    shards = []
+    for path in paths:
+        for manifest in sorted(glob(os.path.join(path, '**', f"*{MANIFEST_SUFFIX}"), recursive=True)):
+            shards.append(manifest[:-len(MANIFEST_SUFFIX)] + '.jsonl')
+    return shards
+
+
+def merge_shards(shards):
+    """One table per N from the record streams of all the shards. The rows of every shard
+    are appended after the previous ones (as process_zx.py does with data*.csv files),
+    dropping the iterations a shard didn't start, and the streamed sums are added up."""
+    tables, streamed = {}, {}
+    for records_path in shards:
+        manifest = load_manifest(records_path)
+        N, niterations = manifest['args']['N'], manifest['args']['niterations']
+        shard_tables = rec.ResultTables(niterations)
+        for record in rec.load_records(records_path):
+            if record['it'] < niterations:
+                shard_tables.add_record(record)
+        df = pandas.DataFrame(
+            {key: list(shard_tables.output_data[key]) for key in shard_tables.output_data})
+        tables.setdefault(N, []).append(df.dropna(how='all'))
+        if N in streamed:
+            streamed[N].merge(shard_tables.streamed)
+        else:
+            streamed[N] = shard_tables.streamed
+    tables = {N: pandas.concat(dfs, ignore_index=True) for N, dfs in tables.items()}
+    return tables, streamed
+
+
+def save_merged(tables, streamed, output):
+    """Writes output/N<N>/data.csv (and streamed_data.csv), the layout read by process_zx.py.
+    output can't hold shards: data.csv is the name of a first shard, and process_zx.py would
+    count the samples of the shards and of the merged file twice."""
+    if find_shards([output]):
+        raise Exception(f"{output} contains shards, merge into a directory of its own")
+    for N, df in tables.items():
+        os.makedirs(os.path.join(output, f"N{N}"), exist_ok=True)
+        df.to_csv(os.path.join(output, f"N{N}", "data.csv"))
+        if streamed[N].sums:
+            streamed[N].save(os.path.join(output, f"N{N}", "streamed_data.csv"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge the shards written by percolation_script.py into one data.csv per N.")
+    parser.add_argument("paths", nargs='+', help="directories searched (recursively) for shard manifests")
+    parser.add_argument("--output", required=True, help="directory in which to write N<N>/data.csv")
+    args = parser.parse_args()
+
+    shards = find_shards(args.paths)
+    tables, streamed = merge_shards(shards)
+    save_merged(tables, streamed, args.output)
+    for N, df in sorted(tables.items()):
+        print(f"N = {N}: {len(df)} rows")
+    print(f"merged {len(shards)} shards into {args.output}")
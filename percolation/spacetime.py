@@ -0,0 +1,169 @@
+import numpy as np
+import percolation.union_find as ufind
+
+# connectivity of each gate, as edges between (row offset, qubit of the pair) of the
+# vertices qubits[2t:2t+3, [q1, q2]] used by the gate at layer t, see util_functions.sample_circuit
+GATE_EDGES = {
+    'swap': [((0, 0), (2, 1)), ((0, 1), (2, 0))],
+    'cnot': [((0, 0), (1, 0)), ((1, 0), (2, 0)), ((0, 1), (1, 1)), ((1, 1), (2, 1)), ((1, 0), (1, 1))],
+    'id': [((0, 0), (2, 0)), ((0, 1), (2, 1))],
+    'bell': [((0, 0), (0, 1)), ((1, 0), (1, 1)), ((1, 0), (2, 0)), ((1, 1), (2, 1))],
+}
+# single qubit spiders don't change the connectivity, so the phase gates are wires
+GATE_CLASSES = {'swap': 'swap', 'cnot': 'cnot', 'lcnot': 'cnot', 'rcnot': 'cnot',
+                'id_projection': 'id', 'lphase': 'id', 'rphase': 'id', 'lrphase': 'id',
+                'bell_projection': 'bell'}
+
+
+class SpacetimeGraph(object):
+    """The circuit before any simplification, as a graph on the (row, qubit) lattice.
+    Vertex row * N + qubit is qubits[row, qubit] of sample_circuit (which is also its pyzx id).
+
+    edges:  (E, 2) vertex indices
+    dq:     displacement of the qubit coordinate along each edge, without wrapping
+    layer:  the layer t of the gate which created each edge
+    slot:   flat index t * (N // 2) + k of that gate in the string circuit (-1 for the idle
+            boundary wires of open circuits)
+    """
+
+    def __init__(self, N, nlayers, edges, dq, layer, slot):
+        self.N = N
+        self.nlayers = nlayers
+        self.nrows = 2 * nlayers + 1
+        self.num_vertices = self.nrows * N
+        self.edges = edges
+        self.dq = dq
+        self.layer = layer
+        self.slot = slot
+
+    def row(self, v):
+        return v // self.N
+
+    def qubit(self, v):
+        return v % self.N
+
+    @property
+    def inputs(self):
+        return np.arange(self.N)
+
+    @property
+    def outputs(self):
+        return np.arange(self.N) + (self.nrows - 1) * self.N
+
+
+def slot_qubits(N, string_circuit):
+    # first qubit of every slot: even layers pair (0, 1), (2, 3), ..., odd layers (1, 2), ...
+    nlayers, ncols = string_circuit.shape
+    return 2 * np.arange(ncols)[None, :] + (np.arange(nlayers) % 2)[:, None]
+
+
+def spacetime_graph(string_circuit, N, periodic=False):
+    string_circuit = np.asarray(string_circuit)
+    nlayers, ncols = string_circuit.shape
+    q1 = slot_qubits(N, string_circuit)
+    layers = np.broadcast_to(np.arange(nlayers)[:, None], q1.shape)
+    slots = np.arange(nlayers * ncols).reshape(nlayers, ncols)
+    # slots reaching past the last qubit only exist with periodic boundaries
+    valid = (q1 + 1 < N) | periodic
+
+    edges, dq, layer, slot = [], [], [], []
+    for name, gate_class in GATE_CLASSES.items():
+        mask = (string_circuit == name) & valid
+        if not mask.any():
+            continue
+        t, k, q = layers[mask], slots[mask], q1[mask]
+        for (ru, wu), (rv, wv) in GATE_EDGES[gate_class]:
+            edges.append(np.stack([(2 * t + ru) * N + (q + wu) % N,
+                                   (2 * t + rv) * N + (q + wv) % N], axis=1))
+            dq.append(np.full(len(t), wv - wu))
+            layer.append(t)
+            slot.append(k)
+
+    if not periodic:
+        # qubits 0 and N-1 are idle in odd layers, sample_circuit connects them straight through
+        t = np.arange(1, nlayers, 2)
+        for q in [0, N - 1]:
+            edges.append(np.stack([2 * t * N + q, (2 * t + 2) * N + q], axis=1))
+            dq.append(np.zeros(len(t), dtype=np.int64))
+            layer.append(t)
+            slot.append(np.full(len(t), -1))
+
+    if not edges:
+        edges = [np.zeros((0, 2), dtype=np.int64)]
+        dq = layer = slot = [np.zeros(0, dtype=np.int64)]
+    return SpacetimeGraph(N, nlayers, np.concatenate(edges), np.concatenate(dq),
+                          np.concatenate(layer), np.concatenate(slot))
+
+
+def wrapping_observables(spacetime, periodic=False):
+    """Whether some cluster of the spacetime graph winds around the qubit direction (periodic
+    circuits), spans the qubit direction and connects the first row to the last one, from a
+    single union-find pass which tracks displacements along the qubits.
+
+    A cluster spans the qubits if its unwrapped extent covers all of them: it connects qubit 0
+    to qubit N-1 through the bulk. With periodic boundaries this doesn't count the edges across
+    the boundary (qubits N-1 and 0 are neighbours there), so a small cluster sitting across it
+    doesn't span, while every cluster which winds around the qubits does (but not conversely).
+    For open circuits it is the same as connecting qubit 0 to qubit N-1."""
+    uf = ufind.DisplacementUnionFind(spacetime.num_vertices)
+    for (u, v), d in zip(spacetime.edges.tolist(), spacetime.dq.tolist()):
+        uf.union(u, v, d)
+
+    N = spacetime.N
+    vertices = np.arange(spacetime.num_vertices)
+    roots = uf.roots(vertices)
+    wraps = np.array(uf.wraps)[roots]
+    wraps_space = bool(periodic) and wraps.any()
+    # after roots, the offsets are the displacements from the roots
+    offsets = np.array(uf.offset)
+    lowest = np.full(spacetime.num_vertices, np.iinfo(np.int64).max)
+    highest = np.full(spacetime.num_vertices, np.iinfo(np.int64).min)
+    np.minimum.at(lowest, roots, offsets)
+    np.maximum.at(highest, roots, offsets)
+    spans_space = wraps.any() or (highest - lowest >= N - 1).any()
+    spans_time = np.intersect1d(roots[spacetime.inputs], roots[spacetime.outputs]).size > 0
+    return wraps_space, bool(spans_space), bool(spans_time)
+
+
+def largest_cluster(spacetime):
+    # fraction of the vertices in the largest cluster, which lc counts on the simplified diagram instead
+    uf = ufind.UnionFind(spacetime.num_vertices)
+    for u, v in spacetime.edges.tolist():
+        uf.union(u, v)
+    # the size of a vertex which is no longer a root is that of a part of its cluster
+    return max(uf.size) / spacetime.num_vertices
+
+
+def connection_vs_depth(spacetime):
+    """connected[d - 1] tells whether the circuit made of the last d layers connects its first
+    row to the outputs, for d = 1..nlayers. The layers are added into one union-find from the
+    last one backwards, checking the newly added row after each of them."""
+    N, nlayers = spacetime.N, spacetime.nlayers
+    uf = ufind.UnionFind(spacetime.num_vertices)
+    has_output = [False] * spacetime.num_vertices
+    for v in spacetime.outputs.tolist():
+        has_output[v] = True
+
+    order = np.argsort(-spacetime.layer, kind='stable')
+    edges = spacetime.edges[order].tolist()
+    # edges of layer t are edges[starts[t]:ends[t]] in the sorted order
+    sorted_layers = -spacetime.layer[order]
+    starts = np.searchsorted(sorted_layers, -np.arange(nlayers), side='left')
+    ends = np.searchsorted(sorted_layers, -np.arange(nlayers), side='right')
+
+    connected = np.zeros(nlayers, dtype=bool)
+    for t in range(nlayers - 1, -1, -1):
+        for u, v in edges[starts[t]:ends[t]]:
+            ru, rv = uf.find(u), uf.find(v)
+            if ru != rv:
+                root = uf.union(ru, rv)
+                has_output[root] = has_output[ru] or has_output[rv]
+        bottom = range(2 * t * N, (2 * t + 1) * N)
+        connected[nlayers - 1 - t] = any(has_output[uf.find(v)] for v in bottom)
+    return connected
+
+
+def disconnection_depth(connected):
+    # first depth (in layers) at which the inputs are no longer connected to the outputs
+    disconnected = np.flatnonzero(~connected)
+    return disconnected[0] + 1 if len(disconnected) else np.nan
@@ -0,0 +1,140 @@
+import itertools
+import numpy as np
+import networkx as nx
+from scipy import sparse
+from scipy.sparse import csgraph
+
+# int8 type codes, pyzx's VertexType for the spiders plus two codes for the inputs/outputs
+BOUNDARY, Z, X, INPUT, OUTPUT = 0, 1, 2, 3, 4
+TYPE_NAMES = {BOUNDARY: "boundary", Z: "Z", X: "X", INPUT: "input", OUTPUT: "output"}
+
+
+class SparseDiagram(object):
+    """Array representation of a pyzx diagram. Vertices are compressed to 0..V-1,
+    where index i stands for the pyzx vertex `vertices[i]`.
+
+    vertices:  int64 array of the pyzx vertex ids
+    types:     int8 array of type codes (see TYPE_NAMES)
+    inputs:    indices of the inputs, in the order of g.inputs()
+    outputs:   indices of the outputs, in the order of g.outputs()
+    edges:     (E, 2) array of vertex indices
+    adjacency: symmetric scipy.sparse CSR adjacency matrix
+    """
+
+    def __init__(self, vertices, types, inputs, outputs, edges):
+        self.vertices = vertices
+        self.types = types
+        self.inputs = inputs
+        self.outputs = outputs
+        self.edges = edges
+        nv = len(vertices)
+        rows = np.concatenate([edges[:, 0], edges[:, 1]])
+        cols = np.concatenate([edges[:, 1], edges[:, 0]])
+        self.adjacency = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(nv, nv))
+
+    def num_vertices(self):
+        return len(self.vertices)
+
+    def num_edges(self):
+        return len(self.edges)
+
+    def to_networkx(self):
+        return csr_to_networkx(self)
+
+
+def pyzx_to_csr(zx_graph):
+    vertices = np.fromiter(zx_graph.vertices(), dtype=np.int64)
+    index = np.full(vertices.max() + 1 if len(vertices) else 0, -1, dtype=np.int64)
+    index[vertices] = np.arange(len(vertices))
+
+    ty = zx_graph.types()
+    types = np.fromiter((ty[v] for v in vertices.tolist()),
+                        dtype=np.int8, count=len(vertices))
+    inputs = _boundary_indices(index, zx_graph.inputs())
+    outputs = _boundary_indices(index, zx_graph.outputs())
+    types[inputs] = INPUT
+    types[outputs] = OUTPUT
+
+    edges = np.fromiter(itertools.chain.from_iterable(zx_graph.edges()),
+                        dtype=np.int64).reshape(-1, 2)
+    return SparseDiagram(vertices, types, inputs, outputs, index[edges])
+
+
+def _boundary_indices(index, boundary):
+    # inputs/outputs which were fused away (e.g. by input_to_X) are still listed by pyzx
+    boundary = np.asarray(boundary, dtype=np.int64)
+    boundary = index[boundary[boundary < len(index)]]
+    return boundary[boundary >= 0]
+
+
+def csr_to_networkx(diagram):
+    """nx.Graph with the same nodes, node order and 'type' attributes as `pyzx_to_networkx`,
+    so the networkx based hfunctions can run on a SparseDiagram."""
+    nx_graph = nx.Graph()
+    names = [TYPE_NAMES[t] for t in range(len(TYPE_NAMES))]
+    nx_graph.add_nodes_from(
+        (v, {'type': names[t]}) for v, t in zip(diagram.vertices.tolist(), diagram.types.tolist()))
+    nx_graph.add_edges_from(diagram.vertices[diagram.edges].tolist())
+    return nx_graph
+
+
+def as_sparse_diagram(G, g):
+    # hfunctions get whatever general_single_iteration's to_graph produced
+    if isinstance(G, SparseDiagram):
+        return G
+    return pyzx_to_csr(g)
+
+
+def component_labels(diagram):
+    return csgraph.connected_components(diagram.adjacency, directed=False)
+
+
+def component_observables(diagram, ncomponents=None, labels=None):
+    """lc, slc (sizes of the two largest clusters relative to the diagram) and is_path
+    (some input shares a cluster with some output), from one labelling of the clusters."""
+    if labels is None:
+        ncomponents, labels = component_labels(diagram)
+    nv = diagram.num_vertices()
+    if nv == 0:
+        return 0, 0, False
+    sizes = np.bincount(labels, minlength=ncomponents)
+    largest = np.partition(sizes, -2)[-2:] if ncomponents > 1 else np.array([0, sizes[0]])
+    lc = largest[1] / nv
+    slc = largest[0] / nv
+    is_path = np.intersect1d(labels[diagram.inputs], labels[diagram.outputs]).size > 0
+    return lc, slc, bool(is_path)
+
+
+def cluster_size_histogram(diagram, ncomponents=None, labels=None):
+    """Number of clusters per vertex of the diagram in the log2 bins [2^k, 2^(k+1)).
+    Dividing by the bin width 2^k estimates the cluster size distribution n_s."""
+    if labels is None:
+        ncomponents, labels = component_labels(diagram)
+    if diagram.num_vertices() == 0:
+        return np.zeros(1)
+    sizes = np.bincount(labels, minlength=ncomponents)
+    bins = np.floor(np.log2(sizes[sizes > 0])).astype(np.int64)
+    return np.bincount(bins) / diagram.num_vertices()
+
+
+def output_connectivity(diagram, labels=None, periodic=False):
+    """Fraction of the pairs of outputs at distance d = |i - j| (the shorter way around for
+    periodic circuits) which are in the same cluster, for every d, from one labelling."""
+    if labels is None:
+        labels = component_labels(diagram)[1]
+    output_labels = labels[diagram.outputs]
+    N = len(output_labels)
+    positions = np.arange(N)
+    distance = np.abs(positions[:, None] - positions[None, :])
+    if periodic:
+        distance = np.minimum(distance, N - distance)
+    connected = output_labels[:, None] == output_labels[None, :]
+    npairs = np.bincount(distance.ravel())
+    return np.bincount(distance.ravel(), weights=connected.ravel()) / npairs
+
+
+def component_hfunction(G, g, **kwargs):
+    # drop-in for percolation_hfunction and find_path_hfunction together
+    lc, slc, is_path = component_observables(as_sparse_diagram(G, g))
+    return {'lc': lc, 'slc': slc, 'is_path': is_path}
@@ -0,0 +1,128 @@
+import numpy as np
+import percolation.gf2 as gf2
+import percolation.spacetime as spt
+
+rng = np.random.default_rng()
+
+# Pauli operators of the Bell measurement, as (x, z) bits on both qubits of the pair
+XX = ((1, 0), (1, 0))
+ZZ = ((0, 1), (0, 1))
+
+
+class Tableau(object):
+    """Pure stabilizer state of N qubits as N generators, each stored as a row of X bits and a
+    row of Z bits packed into uint64 words (column q is bit q % 64 of word q // 64).
+
+    Signs are not tracked: entropies only depend on the stabilizer group up to signs, so the
+    measurements don't need their outcomes. Gates act on columns for all the rows at once and
+    measurements combine whole rows. Swaps only relabel the qubits, through `column`."""
+
+    def __init__(self, N):
+        self.N = N
+        identity = np.eye(N, dtype=bool)
+        self.x = gf2.pack_rows(np.zeros((N, N), dtype=bool))
+        # |0...0>, stabilized by Z_0, ..., Z_{N-1}
+        self.z = gf2.pack_rows(identity)
+        self.column = list(range(N))
+
+    def _bit(self, table, q):
+        w, b = divmod(self.column[q], gf2.WORD_BITS)
+        return (table[:, w] >> np.uint64(b)) & np.uint64(1)
+
+    def _xor_bit(self, table, q, bits):
+        w, b = divmod(self.column[q], gf2.WORD_BITS)
+        table[:, w] ^= bits << np.uint64(b)
+
+    def swap(self, q1, q2):
+        self.column[q1], self.column[q2] = self.column[q2], self.column[q1]
+
+    def cnot(self, control, target):
+        self._xor_bit(self.x, target, self._bit(self.x, control))
+        self._xor_bit(self.z, control, self._bit(self.z, target))
+
+    def measure(self, qubits, pauli):
+        """Measures the Pauli operator given as (x, z) bits on each of `qubits`."""
+        anticommute = np.zeros(self.N, dtype=np.uint64)
+        for q, (px, pz) in zip(qubits, pauli):
+            if pz:
+                anticommute ^= self._bit(self.x, q)
+            if px:
+                anticommute ^= self._bit(self.z, q)
+        rows = np.flatnonzero(anticommute)
+        if len(rows) == 0:
+            # already in the stabilizer group (up to a sign), the state doesn't change
+            return
+        pivot, others = rows[0], rows[1:]
+        self.x[others] ^= self.x[pivot]
+        self.z[others] ^= self.z[pivot]
+        self.x[pivot] = 0
+        self.z[pivot] = 0
+        for q, (px, pz) in zip(qubits, pauli):
+            w, b = divmod(self.column[q], gf2.WORD_BITS)
+            self.x[pivot, w] |= np.uint64(px) << np.uint64(b)
+            self.z[pivot, w] |= np.uint64(pz) << np.uint64(b)
+
+    def bell_measurement(self, q1, q2):
+        self.measure((q1, q2), XX)
+        self.measure((q1, q2), ZZ)
+
+    def entropy(self, subsystem):
+        """Entanglement entropy (in bits) of the qubits in `subsystem`: the rank of the
+        generators restricted to it, minus its size."""
+        columns = [self.column[q] for q in subsystem]
+        x = gf2.unpack_rows(self.x, self.N)[:, columns]
+        z = gf2.unpack_rows(self.z, self.N)[:, columns]
+        return gf2.rank(np.concatenate([x, z], axis=1)) - len(columns)
+
+    def mutual_information(self, A, B):
+        return self.entropy(A) + self.entropy(B) - self.entropy(list(A) + list(B))
+
+
+def apply_layer(tableau, sgates, q1s, periodic=False):
+    # same pairing rules as util_functions.one_layer
+    N = tableau.N
+    for sgate, q1 in zip(sgates, q1s):
+        q2 = q1 + 1
+        if q2 > N or sgate == '':
+            break
+        if q2 == N:
+            if periodic:
+                q2 = 0
+            else:
+                break
+        if sgate == 'swap':
+            tableau.swap(q1, q2)
+        elif sgate == 'lcnot':
+            tableau.cnot(q1, q2)
+        elif sgate == 'rcnot':
+            tableau.cnot(q2, q1)
+        elif sgate == 'cnot':
+            # orientation not fixed by the string circuit
+            if rng.random() > 0.5:
+                q1, q2 = q2, q1
+            tableau.cnot(q1, q2)
+        elif sgate == 'bell_projection':
+            tableau.bell_measurement(q1, q2)
+        elif sgate != 'id_projection':
+            raise ValueError(f"unknown gate {sgate}")
+
+
+def simulate(string_circuit, N, periodic=False):
+    """Final state of the circuit of sample_circuit acting on |0...0> (the state whose
+    diagram is the one of min_cut_X)."""
+    string_circuit = np.asarray(string_circuit)
+    tableau = Tableau(N)
+    for sgates, q1s in zip(string_circuit, spt.slot_qubits(N, string_circuit)):
+        apply_layer(tableau, sgates, q1s.tolist(), periodic)
+    return tableau
+
+
+def antipodal_regions(N):
+    # the regions of mutual_information in custom_module/calculated_quantities.jl: the first
+    # and the last third of the chain, N // 3 qubits apart on both sides when periodic
+    n = N // 3
+    return list(range(n)), list(range(2 * n, 3 * n))
+
+
+def antipodal_mutual_information(tableau):
+    return tableau.mutual_information(*antipodal_regions(tableau.N))
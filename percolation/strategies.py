@@ -0,0 +1,115 @@
+import time
+import numpy as np
+import pandas
+import pyzx as zx
+import percolation.util_functions as uf
+
+# registry of simplification strategies, all called as simp_method(g, quiet=quiet)
+SIMP_STRATEGIES = {}
+
+# observables which a strategy has to leave unchanged to be considered valid
+CALIBRATION_KEYS = ['lc', 'slc', 'is_path', 'min_cut', 'min_cut_ff', 'min_cut_X']
+
+
+def register_strategy(name):
+    def decorator(simp_method):
+        SIMP_STRATEGIES[name] = simp_method
+        return simp_method
+    return decorator
+
+
+register_strategy('custom_simp')(uf.custom_simp)
+register_strategy('basic_simp')(zx.simplify.basic_simp)
+register_strategy('interior_clifford_simp')(zx.simplify.interior_clifford_simp)
+register_strategy('clifford_simp')(zx.simplify.clifford_simp)
+register_strategy('full_reduce')(zx.full_reduce)
+
+REFERENCE_STRATEGY = 'full_reduce'
+
+
+def get_strategy(name):
+    if name not in SIMP_STRATEGIES:
+        raise ValueError(
+            f"unknown simplification strategy '{name}', choose one of {list(SIMP_STRATEGIES)}")
+    return SIMP_STRATEGIES[name]
+
+
+def calibration_hfunction(G, g, **kwargs):
+    lc, slc = uf.percolation_hfunction(G, g, **kwargs)
+    is_path = uf.find_path_hfunction(G, g, **kwargs)
+    min_cut_if = uf.min_cut_first(G, g, **kwargs)
+    min_cut_ff = uf.min_cut_two_halves(G, g, **kwargs)
+    # simplified again by the strategy after the inputs are set to X, on a copy since that's in place
+    min_cut_X = uf.min_cut_X(G, g.copy(), **kwargs)
+    return {'lc': lc, 'slc': slc, 'is_path': is_path, 'min_cut': min_cut_if, 'min_cut_ff': min_cut_ff,
+            'min_cut_X': min_cut_X}
+
+
+def time_strategy(g, name, quiet=True):
+    # g should already be cleaned by remove_excess_nodes, and is simplified in place
+    nvertices = g.num_vertices()
+    start = time.perf_counter()
+    SIMP_STRATEGIES[name](g, quiet=quiet)
+    elapsed = time.perf_counter() - start
+    return elapsed, nvertices
+
+
+def calibrate_sample(N, t_factor, p, q, r, strategies=None, periodic=False):
+    """Simplifies one sampled circuit with every strategy and compares the observables
+    to those of the reference strategy. All strategies work on copies of the same unsimplified
+    graph, built once from the string circuit (whose lcnot/rcnot fix the cnot orientations)."""
+    if strategies is None:
+        strategies = list(SIMP_STRATEGIES)
+    string_circuit = uf.sample_string_circuit(
+        N, t_factor, p, q, r, periodic=periodic)
+    g0 = uf.sample_circuit(
+        N, t_factor, string_circuit=string_circuit, apply_state=False, periodic=periodic)
+    uf.remove_excess_nodes(g0)
+
+    rows, reference = [], None
+    for name in [REFERENCE_STRATEGY] + [s for s in strategies if s != REFERENCE_STRATEGY]:
+        g = g0.copy()
+        elapsed, nvertices = time_strategy(g, name)
+        observables = calibration_hfunction(
+            uf.pyzx_to_networkx(g), g, quiet=True, simp_method=SIMP_STRATEGIES[name])
+        if reference is None:
+            reference = observables
+        valid = all(np.isclose(float(observables[key]), float(reference[key]))
+                    for key in CALIBRATION_KEYS)
+        rows.append({'strategy': name, 'time': elapsed, 'nvertices': nvertices,
+                     'time_per_vertex': elapsed / max(nvertices, 1), 'valid': valid})
+    return rows
+
+
+def calibrate(Ns, t_factor, ps, qs, rs, niterations, strategies=None, periodic=False):
+    rows = []
+    for N in Ns:
+        for p in ps:
+            for q in qs:
+                for r in rs:
+                    for it in range(niterations):
+                        for row in calibrate_sample(N, t_factor, p, q, r, strategies, periodic):
+                            row.update({'N': N, 'p': p, 'q': q, 'r': r, 'iteration': it})
+                            rows.append(row)
+    return pandas.DataFrame(rows)
+
+
+def select_strategies(calibration_df):
+    """Returns, for each calibrated (N, p, q, r), the fastest strategy which reproduced the
+    reference observables on every sample."""
+    summary = calibration_df.groupby(['N', 'p', 'q', 'r', 'strategy']).agg(
+        time_per_vertex=('time_per_vertex', 'mean'), valid=('valid', 'all')).reset_index()
+    summary = summary[summary['valid']].sort_values('time_per_vertex')
+    return summary.groupby(['N', 'p', 'q', 'r']).head(1).sort_values(
+        ['N', 'p', 'q', 'r']).reset_index(drop=True)
+
+
+def choose_strategy(strategy_table, N, p, q, r):
+    # nearest calibrated point, with N compared on a log scale
+    distance = (np.log(strategy_table['N'] / N)) ** 2 + (strategy_table['p'] - p) ** 2 + \
+        (strategy_table['q'] - q) ** 2 + (strategy_table['r'] - r) ** 2
+    return strategy_table['strategy'].iloc[int(np.argmin(distance.to_numpy()))]
+
+
+def load_strategy_table(path):
+    return pandas.read_csv(path, index_col=0)
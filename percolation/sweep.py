@@ -0,0 +1,216 @@
+import argparse
+import os
+import shlex
+import shutil
+import sys
+import tomllib
+import numpy as np
+import pandas
+import percolation.percolation_script as script
+import percolation.records as rec
+import percolation.shards as shards
+import percolation.strategies as st
+import percolation.scheduling as sch
+
+
+def load_timings(paths, strategy=st.REFERENCE_STRATEGY):
+    """Seconds per stage and sample, from the records of the shards found in directories
+    (telemetry) or from the simplification times of `strategy` in a calibration.csv of
+    calibrate_strategies.py (benchmark)."""
+    tables = []
+    for path in paths:
+        if path.endswith('.csv'):
+            df = pandas.read_csv(path, index_col=0)
+            df = df[df['strategy'] == strategy]
+            tables.append(pandas.DataFrame({'N': df['N'], 'p': df['p'], 'q': df['q'], 'r': df['r'],
+                                            'simplify': df['time']}))
+            continue
+        rows = [dict(N=record['N'], p=record['p'], q=record['q'], r=record['r'], **record['timings'])
+                for records_path in shards.find_shards([path])
+                for record in rec.load_records(records_path) if 'timings' in record]
+        tables.append(pandas.DataFrame(rows))
+    return pandas.concat(tables, ignore_index=True)
+
+
+### SWEEP SPECS
+
+# spec keys which are named differently in percolation_script.py
+SPEC_ALIASES = {'engine': 'simp_method'}
+
+
+def load_spec(path):
+    if path.endswith(('.yaml', '.yml')):
+        # only needed for YAML specs
+        import yaml
+        with open(path) as file:
+            return yaml.safe_load(file)
+    with open(path, 'rb') as file:
+        return tomllib.load(file)
+
+
+def expand_grid(value):
+    """The values of a grid given as a number, a list, or a table {start, stop, num} of evenly
+    spaced values (with log = true evenly spaced logarithms, with multiple = m rounded down
+    to multiples of m and without duplicates)."""
+    if isinstance(value, dict):
+        space = np.geomspace if value.get('log', False) else np.linspace
+        values = space(value['start'], value['stop'], value['num'])
+        if 'multiple' in value:
+            values = values // value['multiple'] * value['multiple']
+        return sorted(set(np.round(values, 10).tolist()))
+    if isinstance(value, list):
+        return value
+    return [value]
+
+
+def spec_arguments(spec):
+    """(Ns, save_path, percolation_script.py arguments) of a sweep spec: the N ladder, where to
+    save it and every other key as the argument of the same name."""
+    spec = dict(spec)
+    save_path = spec.pop('save_path')
+    Ns = [int(N) for N in expand_grid(spec.pop('N'))]
+    if 'seed' not in spec:
+        raise Exception("a sweep spec needs a seed, which identifies its samples in the result store")
+    # grids can be extended without changing the samples of the points they already had
+    argv = ['--seed_by_point']
+    for key, value in spec.items():
+        key = SPEC_ALIASES.get(key, key)
+        flag = f"-{key}" if key in ['p', 'q', 'r'] else f"--{key}"
+        if isinstance(value, bool):
+            argv += [flag] if value else []
+        elif key in ['p', 'q', 'r']:
+            argv += [flag, *map(str, expand_grid(value))]
+        elif isinstance(value, list):
+            argv += [flag, *map(str, value)]
+        else:
+            argv += [flag, str(value)]
+    return Ns, save_path, argv
+
+
+def stored_keys(args):
+    """(p, q, r, iteration) keys of the samples in the shards of args.save_path which a run of
+    `args` would draw again: same seed and shards.MATCHING_ARGS, with all of args.observables."""
+    keys = set()
+    if args.seed is None:
+        return keys
+    for records_path in shards.find_shards([args.save_path]):
+        manifest = shards.load_manifest(records_path)
+        if manifest['entropy'] != args.seed or manifest.get('seed_keys') != shards.seed_layout(args):
+            continue
+        if shards.mismatched_args(manifest['args'], args):
+            continue
+        if not set(args.observables) <= set(manifest['args']['observables']):
+            continue
+        keys |= rec.completed_keys(rec.load_records(records_path))
+    return keys
+
+
+### SCHEDULING
+
+def volume_cost(task):
+    # without timings, the spacetime volume of the circuits orders the tasks
+    N, _, points, _ = task
+    return N ** 2 * len(points)
+
+
+def predict(run_args, done, task_cost, ncores):
+    """Predicted seconds of every N and wall times of the sweep (without the samples in
+    done[N]), packed on one pool and run one N after the other (as run_script.sh does)."""
+    rows, makespans, all_costs = [], [], []
+    for args in run_args:
+        costs = [task_cost(task) for task in script.make_tasks(args, done[args.N])]
+        rows.append({'N': args.N, 'tasks': len(costs), 'stored': len(done[args.N]),
+                     'cpu_seconds': sum(costs), 'longest_task': max(costs, default=0.0)})
+        makespans.append(sch.lpt_makespan(costs, ncores))
+        all_costs += costs
+    return pandas.DataFrame(rows), sch.lpt_makespan(all_costs, ncores), sum(makespans)
+
+
+def sweep_arguments(args, script_argv):
+    """(save_path, percolation_script.py arguments of every N) of a sweep given by --spec or by
+    -N, --save_path and the script arguments."""
+    if args.spec is not None:
+        Ns, save_path, script_argv = spec_arguments(load_spec(args.spec))
+    elif args.N is not None:
+        Ns, save_path = args.N, args.save_path
+    else:
+        raise Exception("give either -N or --spec")
+
+    run_args = []
+    for N in Ns:
+        run_args.append(script.parse_args(script_argv + ['-N', str(N), '--save_path', os.path.join(save_path, f"N{N}")]))
+        run_args[-1].p.sort()
+        run_args[-1].q.sort()
+        run_args[-1].r.sort()
+    return save_path, run_args
+
+
+def sweep_task_cost(args):
+    if args.timings:
+        return sch.fit_cost_model(load_timings(args.timings)).task_cost
+    return volume_cost
+
+
+def add_sweep_arguments(parser):
+    parser.add_argument("--spec", help="TOML or YAML sweep spec, instead of -N, --save_path and the script arguments")
+    parser.add_argument("-N", nargs='+', type=int, help="system sizes")
+    parser.add_argument("--save_path", default="data/test", help="path in which to save the data, in N<N>/")
+    parser.add_argument("--timings", nargs='*', default=[],
+                        help="shard directories or calibration.csv files to fit the cost model to")
+
+
+def write_run_script(save_path, argv):
+    """Writes save_path/run_script.sh running the sweep again, unless there is one already: the
+    directories of data/ with a run_script.sh are the runs process_zx.py processes."""
+    path = os.path.join(save_path, "run_script.sh")
+    if os.path.exists(path):
+        return
+    with open(path, 'w') as file:
+        file.write("#!/bin/bash\n"
+                   "# written by sweep.py\n"
+                   f"cd {shlex.quote(os.getcwd())}\n"
+                   f"python -m percolation.sweep {shlex.join(argv[1:])}\n")
+    os.chmod(path, 0o755)
+
+
+def format_seconds(seconds):
+    hours, rest = divmod(int(round(seconds)), 3600)
+    return f"{hours}:{rest // 60:02d}:{rest % 60:02d}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run percolation_script.py for several N on one pool, longest tasks first, skipping the samples "
+                    "already stored with the same seed. Arguments not listed here are passed on to percolation_script.py.")
+    add_sweep_arguments(parser)
+    parser.add_argument("--dry_run", action='store_true',
+                        help="print the predicted wall time of the sweep instead of running it")
+    args, script_argv = parser.parse_known_args()
+
+    save_path, run_args = sweep_arguments(args, script_argv)
+    ncores = run_args[0].ncores
+    done = {run.N: stored_keys(run) for run in run_args}
+    task_cost = sweep_task_cost(args)
+    if args.dry_run:
+        if not args.timings:
+            raise Exception("--dry_run needs --timings to predict seconds")
+        per_N, packed, one_by_one = predict(run_args, done, task_cost, ncores)
+        print(per_N.to_string(index=False))
+        print(f"predicted wall time on {ncores} cores: {format_seconds(packed)} "
+              f"(one N after the other: {format_seconds(one_by_one)})")
+    else:
+        strategy_table, chunksize = script.load_strategy_table(run_args[0]), run_args[0].chunksize
+        telemetry = script.make_telemetry(run_args[0])
+        # sizes with all their samples stored get no new shard
+        run_args = [run for run in run_args if run.target_error is not None or script.make_tasks(run, done[run.N])]
+        for run in run_args:
+            os.makedirs(run.save_path, exist_ok=True)
+        os.makedirs(save_path, exist_ok=True)
+        if args.spec is not None:
+            # kept with the data, as run_script.sh copies itself
+            shutil.copy(args.spec, save_path)
+        write_run_script(save_path, sys.argv)
+        print(f"{sum(len(keys) for keys in done.values())} samples already stored")
+        script.run_shards([script.ShardRun(run, done[run.N]) for run in run_args], ncores, chunksize,
+                          strategy_table, task_cost, telemetry)
+        print(f"sweep is done. args were: {args}, {script_argv}")
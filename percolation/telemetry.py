@@ -0,0 +1,159 @@
+import argparse
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+
+
+class Telemetry(object):
+    """Throughput of a run, written every `interval` seconds as one JSON line to `path`,
+    which is rotated (path.1, path.2, ...) once it reaches max_bytes.
+
+    Every snapshot has the samples per second of every (N, p) and the share of every stage
+    (see util_functions.general_single_iteration) over the last interval, the tasks left in
+    the queue and the ETA at the task rate of the last interval. The snapshots are written
+    by a thread of their own, so that a stalled run still writes them (with a zero rate),
+    and recording a sample only adds a few numbers to the current interval."""
+
+    def __init__(self, path, interval=30, max_bytes=2 ** 24, backups=5):
+        self.interval = interval
+        # a logger of its own per file, so that several runs in one process don't share handlers
+        self.logger = logging.getLogger(f"{__name__}.{os.path.abspath(path)}")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups)
+        self.logger.addHandler(self.handler)
+        self.start = self.last = time.monotonic()
+        self.samples = self.tasks = 0
+        self.queue_depth = None
+        self.lock = threading.Lock()
+        self._reset_window()
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _reset_window(self):
+        self.window_tasks = 0
+        # (N, p) -> [samples, seconds]
+        self.window_points = {}
+        self.window_stages = {}
+
+    def add(self, N, p, timings):
+        with self.lock:
+            point = self.window_points.setdefault((N, p), [0, 0.0])
+            point[0] += 1
+            for stage, seconds in timings.items():
+                point[1] += seconds
+                self.window_stages[stage] = self.window_stages.get(stage, 0.0) + seconds
+            self.samples += 1
+
+    def set_queue_depth(self, queue_depth):
+        with self.lock:
+            self.queue_depth = queue_depth
+
+    def task_done(self, queue_depth=None):
+        # queue_depth: the tasks left, if known
+        with self.lock:
+            self.window_tasks += 1
+            self.tasks += 1
+            if queue_depth is not None:
+                self.queue_depth = queue_depth
+
+    def _run(self):
+        while not self.stop.wait(self.interval):
+            self.snapshot()
+
+    def snapshot(self, final=False):
+        """Writes the snapshot of the interval since the previous one, `final` for the one of close."""
+        with self.lock:
+            now = time.monotonic()
+            window = max(now - self.last, 1e-9)
+            points, stages, ntasks = self.window_points, self.window_stages, self.window_tasks
+            samples, tasks, queue_depth = self.samples, self.tasks, self.queue_depth
+            self.last = now
+            self._reset_window()
+        task_rate = ntasks / window
+        total_stages = sum(stages.values())
+        eta = None
+        if queue_depth is not None and task_rate > 0:
+            eta = queue_depth / task_rate
+        self.logger.info(json.dumps({
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'elapsed': now - self.start,
+            'samples': samples,
+            'tasks': tasks,
+            'rate': sum(n for n, _ in points.values()) / window,
+            'task_rate': task_rate,
+            'queue_depth': queue_depth,
+            'eta': eta,
+            'stage_shares': {stage: seconds / total_stages for stage, seconds in stages.items()}
+            if total_stages > 0 else {},
+            'points': [{'N': N, 'p': p, 'rate': n / window, 'seconds_per_sample': seconds / n}
+                       for (N, p), (n, seconds) in sorted(points.items())],
+            'final': final,
+        }))
+        self.handler.flush()
+
+    def close(self):
+        self.stop.set()
+        self.thread.join()
+        self.snapshot(final=True)
+        self.logger.removeHandler(self.handler)
+        self.handler.close()
+
+
+def format_snapshot(snapshot):
+    eta = snapshot['eta']
+    eta = '?' if eta is None else f"{int(eta) // 3600}:{int(eta) % 3600 // 60:02d}:{int(eta) % 60:02d}"
+    stages = ' '.join(f"{stage} {share:.0%}" for stage, share in snapshot['stage_shares'].items())
+    queue_depth = '?' if snapshot['queue_depth'] is None else snapshot['queue_depth']
+    line = (f"{snapshot['time']}  {snapshot['samples']} samples  {snapshot['rate']:.2f}/s  "
+            f"{queue_depth} tasks left  eta {eta}  [{stages}]")
+    if snapshot['points']:
+        slowest = max(snapshot['points'], key=lambda point: point['seconds_per_sample'])
+        line += f"  slowest N={slowest['N']} p={slowest['p']} {slowest['seconds_per_sample']:.3g} s/sample"
+    if snapshot.get('final', False):
+        # the run is over, whatever came back since the last snapshot
+        line += "  FINAL"
+    elif snapshot['rate'] == 0 and snapshot['queue_depth'] != 0:
+        # nothing came back during the whole interval while there is work left
+        line += "  STALLED"
+    return line
+
+
+def follow(path, poll=2):
+    """Yields the snapshots of a metrics file as they are written, across rotations."""
+    file, inode = None, None
+    while True:
+        if file is None and os.path.exists(path):
+            file, inode = open(path), os.stat(path).st_ino
+        line = file.readline() if file is not None else ''
+        if line.endswith('\n'):
+            yield json.loads(line)
+            continue
+        if line:
+            # a line being written, read again from its start
+            file.seek(file.tell() - len(line))
+        if file is not None and os.path.exists(path) and os.stat(path).st_ino != inode:
+            # rotated, the rest is in the new file
+            file.close()
+            file = None
+            continue
+        time.sleep(poll)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print the snapshots of a metrics file written with --metrics.")
+    parser.add_argument("path", help="metrics file")
+    parser.add_argument("--follow", action='store_true', help="keep printing the new snapshots")
+    args = parser.parse_args()
+
+    if args.follow:
+        for snapshot in follow(args.path):
+            print(format_snapshot(snapshot), flush=True)
+    else:
+        with open(args.path) as file:
+            for line in file:
+                print(format_snapshot(json.loads(line)))
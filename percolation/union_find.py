@@ -0,0 +1,111 @@
+import numpy as np
+
+
+class UnionFind(object):
+    """Disjoint sets over 0..n-1 with union by size and path compression."""
+
+    def __init__(self, n):
+        self.parent = list(range(n))
+        self.size = [1] * n
+
+    def find(self, x):
+        parent = self.parent
+        root = x
+        while parent[root] != root:
+            root = parent[root]
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    def union(self, u, v):
+        """Merges the sets of u and v, returns the new root (or the common one)."""
+        ru, rv = self.find(u), self.find(v)
+        if ru == rv:
+            return ru
+        if self.size[ru] < self.size[rv]:
+            ru, rv = rv, ru
+        self.parent[rv] = ru
+        self.size[ru] += self.size[rv]
+        return ru
+
+    def roots(self, vertices):
+        return np.array([self.find(v) for v in vertices], dtype=np.int64)
+
+
+class DisplacementUnionFind(UnionFind):
+    """Union-find which also keeps, for every vertex, its displacement relative to the root of
+    its set along a periodic direction. An edge closing a loop whose displacements don't add
+    up to zero means the cluster winds around the periodic direction."""
+
+    def __init__(self, n):
+        super().__init__(n)
+        self.offset = [0] * n
+        self.wraps = [False] * n
+
+    def find(self, x):
+        parent, offset = self.parent, self.offset
+        path = []
+        while parent[x] != x:
+            path.append(x)
+            x = parent[x]
+        # path compression, accumulating the offsets from the top of the path down
+        for v in reversed(path):
+            if parent[v] != x:
+                offset[v] += offset[parent[v]]
+                parent[v] = x
+        return x
+
+    def union(self, u, v, displacement):
+        """Adds the edge u -> v, along which the periodic coordinate changes by `displacement`."""
+        ru, rv = self.find(u), self.find(v)
+        du, dv = self.offset[u], self.offset[v]
+        if ru == rv:
+            if du + displacement != dv:
+                self.wraps[ru] = True
+            return ru
+        # position(rv) - position(ru) = du + displacement - dv
+        d = du + displacement - dv
+        if self.size[ru] < self.size[rv]:
+            ru, rv, d = rv, ru, -d
+        self.parent[rv] = ru
+        self.offset[rv] = d
+        self.size[ru] += self.size[rv]
+        self.wraps[ru] = self.wraps[ru] or self.wraps[rv]
+        return ru
+
+
+class RollbackUnionFind(object):
+    """Union-find with union by size but no path compression, so that the unions can be
+    undone in reverse order (offline dynamic connectivity, see microcanonical.py)."""
+
+    def __init__(self, n):
+        self.parent = list(range(n))
+        self.size = [1] * n
+        self.history = []
+
+    def find(self, x):
+        parent = self.parent
+        while parent[x] != x:
+            x = parent[x]
+        return x
+
+    def union(self, u, v):
+        """Merges the sets of u and v, returns (new root, merged root) or None if they were
+        already the same set."""
+        ru, rv = self.find(u), self.find(v)
+        if ru == rv:
+            return None
+        if self.size[ru] < self.size[rv]:
+            ru, rv = rv, ru
+        self.parent[rv] = ru
+        self.size[ru] += self.size[rv]
+        self.history.append(rv)
+        return ru, rv
+
+    def rollback(self, mark):
+        """Undoes the unions made since len(history) was `mark`."""
+        while len(self.history) > mark:
+            rv = self.history.pop()
+            ru = self.parent[rv]
+            self.size[ru] -= self.size[rv]
+            self.parent[rv] = rv
@@ -1,10 +1,11 @@
 # imports
+import time
 import numpy as np
 import matplotlib.pyplot as plt
 import pandas
 import pyzx as zx
 import networkx as nx
-from tqdm.notebook import tqdm, trange
+import percolation.sparse_graph as sg
 
 rng = np.random.default_rng()
 
@@ -71,17 +72,28 @@ def remove_excess_nodes(g):
 
 # -> list:
 def sample_string_circuit(N, t_factor, p, q, r, periodic=False, **kwargs):
-    # generate a row
-    # print(p, q, r)
+    return threshold_string_circuit(*sample_slot_variates(N, t_factor), p, q, r, periodic)
+
+
+def sample_slot_variates(N, t_factor):
+    """Per gate slot: a uniform deciding between unitary and measurement, a uniform deciding
+    the kind of gate within them and the orientation of a cnot."""
     total_t = int(N * t_factor) // 2 * 2
-    lgates = ["swap", "cnot", "id_projection", "bell_projection"]
-    lprobs = [(1-p) * (1-r), (1-p) * r, p * (1 - q), p * q]
-    circuit = np.full((total_t, N//2), '*' * 15)
-    for i in range(0, total_t, 2):
-        circuit[i, :] = rng.choice(lgates, size=N//2, p=lprobs)
-        circuit[i+1, :] = rng.choice(lgates, size=N//2, p=lprobs)
-        if not periodic:
-            circuit[i+1, -1] = ""
+    shape = (total_t, N//2)
+    return rng.random(shape), rng.random(shape), rng.random(shape) < 0.5
+
+
+def threshold_string_circuit(measure_variates, kind_variates, orientations, p, q, r, periodic=False):
+    """Gate array of the slot variates at (p, q, r). Thresholding the same variates at several
+    points couples their circuits (common random numbers): raising p only turns unitaries into
+    measurements, raising r only swaps into cnots and raising q only id into bell projections."""
+    measured = measure_variates < p
+    circuit = np.where(measured,
+                       np.where(kind_variates < q, "bell_projection", "id_projection"),
+                       np.where(kind_variates < r, np.where(orientations, "lcnot", "rcnot"), "swap"))
+    circuit = circuit.astype('<U15')
+    if not periodic:
+        circuit[1::2, -1] = ""
     return circuit
 
 
@@ -134,31 +146,91 @@ def custom_simp(g, quiet):
     return g
 
 
-def simplify_circuit(g, quiet=False, simp_method=custom_simp, **kwargs):
+def simplify_circuit(g, quiet=False, simp_method=custom_simp, check_invariants=False, **kwargs):
     remove_excess_nodes(g)
-    return simp_method(g, quiet, **kwargs)
+    if check_invariants:
+        check_pipeline_invariants(g, 'remove_excess_nodes')
+    output = simp_method(g, quiet=quiet, **kwargs)
+    if check_invariants:
+        # custom_simp only fuses spiders, so X-spiders and simple edges remain
+        check_pipeline_invariants(
+            g, 'simplified', graph_like=simp_method is not custom_simp)
+    return output
 
-# Convert pyzx graph to networkx graph with node types
+### INVARIANTS
 
+def graph_like_violations(g, strict=False):
+    """Lists the ways in which g is not graph-like. Only iterates over the vertices and
+    the edges, so it is O(V + E) rather than going over all vertex pairs.
+    If `strict` is True, also checks that each boundary is connected to a Z-spider and
+    that each Z-spider is connected to at most one boundary."""
+    violations = []
+    ty = g.types()
+    for v in g.vertices():
+        if ty[v] not in [zx.VertexType.Z, zx.VertexType.BOUNDARY]:
+            violations.append(f"vertex {v} is not a Z-spider")
+
+    for e in g.edges():
+        v1, v2 = g.edge_st(e)
+        if ty[v1] == zx.VertexType.Z and ty[v2] == zx.VertexType.Z \
+                and g.edge_type(e) != zx.EdgeType.HADAMARD:
+            violations.append(f"Z-spiders {v1}, {v2} are not connected by a Hadamard edge")
+
+    violations += self_loop_violations(g)
+
+    if strict:
+        boundaries = [v for v in g.vertices() if ty[v] == zx.VertexType.BOUNDARY]
+        b_neighbors = []
+        for b in boundaries:
+            neighbors = list(g.neighbors(b))
+            if len(neighbors) != 1 or ty[neighbors[0]] != zx.VertexType.Z:
+                violations.append(f"boundary {b} is not connected to a single Z-spider")
+            else:
+                b_neighbors.append(neighbors[0])
+        if len(set(b_neighbors)) != len(b_neighbors):
+            violations.append("a Z-spider is connected to more than one boundary")
+
+    return violations
+
+
+def self_loop_violations(g):
+    # pyzx edges() skips self-loops, so those are checked per vertex
+    return [f"vertex {v} has a self-loop" for v in g.vertices() if g.connected(v, v)]
 
-def pyzx_to_networkx(zx_graph):
-    types = {0: "boundary", 1: "Z", 2: "X", 3: "input", 4: "output"}
-    nx_graph = nx.Graph()
 
-    # Add vertices with types as attributes
-    for v in zx_graph.vertices():
-        node_type = types[zx_graph.type(v)]
-        if v in zx_graph.inputs():
-            node_type = 'input'
-        if v in zx_graph.outputs():
-            node_type = 'output'
-        nx_graph.add_node(v, type=node_type)
+def boundary_violations(g):
+    # every boundary left is an input/output with exactly one neighbor
+    violations = []
+    io = set(g.inputs()) | set(g.outputs())
+    ty = g.types()
+    for v in g.vertices():
+        if ty[v] == zx.VertexType.BOUNDARY and v not in io:
+            violations.append(f"boundary {v} is neither an input nor an output")
+    for v in io:
+        if g.vertex_degree(v) != 1:
+            violations.append(f"input/output {v} has degree {g.vertex_degree(v)}")
+    return violations
+
+
+def check_pipeline_invariants(g, stage, graph_like=True, strict=False):
+    """Cheap checks to keep switched on in production runs, after `remove_excess_nodes`
+    (stage 'remove_excess_nodes') and after simplification (stage 'simplified')."""
+    violations = boundary_violations(g)
+    if stage == 'simplified' and graph_like:
+        violations += graph_like_violations(g, strict)
+    else:
+        violations += self_loop_violations(g)
+    if violations:
+        raise Exception(
+            f"pipeline invariants broken after {stage}: " + "; ".join(violations[:10]))
+
+
+# Convert pyzx graph to networkx graph with node types
 
-    # Add edges
-    for e in zx_graph.edges():
-        nx_graph.add_edge(e[0], e[1])
 
-    return nx_graph
+def pyzx_to_networkx(zx_graph):
+    # goes through the array export, which avoids scanning the inputs/outputs per vertex
+    return sg.csr_to_networkx(sg.pyzx_to_csr(zx_graph))
 
 
 def networkx_to_pyzx(nx_graph):
@@ -195,8 +267,14 @@ def swap(g, qubits, q1, q2, t):
 
 
 def cnot(g, qubits, q1, q2, t):
+    # random orientation, sample_string_circuit draws it in advance as lcnot / rcnot
     if rng.random() > 0.5:
         q1, q2 = q2, q1
+    lcnot(g, qubits, q1, q2, t)
+
+
+def lcnot(g, qubits, q1, q2, t):
+    # control on q1
     g.set_type(qubits[2*t + 1, q1], zx.VertexType.Z)
     g.set_type(qubits[2*t + 1, q2], zx.VertexType.X)
 
@@ -211,6 +289,10 @@ def cnot(g, qubits, q1, q2, t):
     g.add_edge(g.edge(*qubits[2*t + 1, [q1, q2]]), zx.EdgeType.SIMPLE)
 
 
+def rcnot(g, qubits, q1, q2, t):
+    return lcnot(g, qubits, q2, q1, t)
+
+
 def id_projection(g, qubits, q1, q2, t):
     g.remove_vertices(qubits[2*t+1, [q1, q2]])
     g.add_edge(g.edge(*qubits[[2*t, 2*t + 2], q1]), zx.EdgeType.SIMPLE)
@@ -247,6 +329,7 @@ def plot_network(g, **kwargs):
 def test_circuit(string_circuit, p, q, r, **kwargs):
     expected = pandas.Series({'swap': (1-r) * (1-p), 'cnot': r *
                              (1-p), 'bell_projection': p * q, 'id_projection': p * (1-q)})
+    string_circuit = np.where(np.isin(string_circuit, ["lcnot", "rcnot"]), "cnot", string_circuit)
     unique, counts = np.unique(string_circuit, return_counts=True)
 
     sc = pandas.Series(counts, unique)
@@ -256,7 +339,10 @@ def test_circuit(string_circuit, p, q, r, **kwargs):
 
 
 
-def general_single_iteration(N, t_factor, function, quiet=False, periodic=False, **kwargs):# -> Any:
+def general_single_iteration(N, t_factor, function, quiet=False, periodic=False, check_invariants=False, to_graph=pyzx_to_networkx, timings=None, **kwargs):# -> Any:
+    # to_graph converts the simplified diagram into the G given to function, e.g. sg.pyzx_to_csr
+    # timings, if given, is filled with the seconds spent in every stage (sample, simplify, observables)
+    start = time.perf_counter()
     if 'simp_method' not in kwargs:
         kwargs['simp_method'] = zx.full_reduce
     if 'string_circuit' not in kwargs:
@@ -274,21 +360,28 @@ def general_single_iteration(N, t_factor, function, quiet=False, periodic=False,
     g = sample_circuit(
         N, t_factor, string_circuit=kwargs['string_circuit'], apply_state=False, periodic=periodic)
     # d['raw'] = g.num_vertices()
-    simplify_circuit(g, quiet, simp_method=kwargs['simp_method'])
+    sampled = time.perf_counter()
+    simplify_circuit(g, quiet, simp_method=kwargs['simp_method'],
+                     check_invariants=check_invariants)
+    simplified = time.perf_counter()
     # d['simp'] = g.num_vertices()
     if not quiet:
         gc = g.copy()
         gc.normalize()
         zx.draw(gc, labels=True)
-    G = pyzx_to_networkx(g)
+    G = to_graph(g)
     # d['nx'] = G.number_of_nodes()
     # return d
 
     kwargs['N'] = N
     kwargs['t_factor'] = t_factor
+    kwargs['periodic'] = periodic
 
     kwargs['quiet'] = quiet
     output = function(G, g, **kwargs)
+    if timings is not None:
+        timings.update(sample=sampled - start, simplify=simplified - sampled,
+                       observables=time.perf_counter() - simplified)
     if not quiet:
         print(output)
     return output
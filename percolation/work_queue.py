@@ -0,0 +1,277 @@
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import numpy as np
+import percolation.percolation_script as script
+import percolation.records as rec
+import percolation.shards as shards
+import percolation.sweep as sweep
+import percolation.telemetry as tel
+
+# the database only needs a filesystem shared by the nodes, no server. Its default rollback
+# journal is used, since WAL needs shared memory which network filesystems don't provide
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS shards (
+    id INTEGER PRIMARY KEY, N INTEGER, records_path TEXT, args TEXT, entropy TEXT);
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY, shard INTEGER, task TEXT, cost REAL,
+    state TEXT DEFAULT 'pending', worker TEXT, lease_expires REAL, attempts INTEGER DEFAULT 0);
+CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, cost);
+CREATE TABLE IF NOT EXISTS workers (
+    name TEXT PRIMARY KEY, host TEXT, pid INTEGER, started REAL, heartbeat REAL, ntasks INTEGER DEFAULT 0);
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY, shard INTEGER, task INTEGER, record TEXT);
+"""
+
+
+def connect(path, timeout=60):
+    # autocommit, the transactions are opened explicitly. Writers wait for each other up to a minute
+    db = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+    db.executescript(SCHEMA)
+    return db
+
+
+def queued_keys(db, args):
+    """(p, q, r, iteration) keys of the tasks already in the queue for the shards of
+    args.save_path with the same seed and circuit arguments, see sweep.stored_keys."""
+    keys = set()
+    if args.seed is None:
+        return keys
+    for shard, records_path, shard_args in db.execute("SELECT id, records_path, args FROM shards").fetchall():
+        shard_args = json.loads(shard_args)
+        if os.path.dirname(records_path) != args.save_path or shard_args['seed'] != args.seed:
+            continue
+        if shards.mismatched_args(shard_args, args):
+            continue
+        if not set(args.observables) <= set(shard_args['observables']):
+            continue
+        for task, in db.execute("SELECT task FROM tasks WHERE shard = ?", (shard,)):
+            _, it, points, _ = json.loads(task)
+            keys.update(tuple(point) + (it,) for point in points)
+    return keys
+
+
+def submit(db, run_args, done, task_cost):
+    """Adds one shard per N (with its manifest, as percolation_script.py would) and its tasks,
+    without the samples in done[N]. Returns the number of tasks added."""
+    ntasks = 0
+    for args in run_args:
+        if args.target_error is not None:
+            raise Exception("adaptive sampling (--target_error) can't run from the work queue")
+        tasks = script.make_tasks(args, done[args.N])
+        if not tasks:
+            continue
+        os.makedirs(args.save_path, exist_ok=True)
+        records_path = f"{args.save_path}/{os.path.splitext(script.get_data_name(args.save_path))[0]}.jsonl"
+        entropy = args.seed if args.seed is not None else np.random.SeedSequence().entropy
+        shards.write_manifest(records_path, args, entropy)
+        db.execute("BEGIN IMMEDIATE")
+        # the entropy is a 128 bit integer, beyond sqlite's integers
+        shard = db.execute("INSERT INTO shards (N, records_path, args, entropy) VALUES (?, ?, ?, ?)",
+                           (args.N, records_path, json.dumps(vars(args)), str(entropy))).lastrowid
+        db.executemany("INSERT INTO tasks (shard, task, cost) VALUES (?, ?, ?)",
+                       [(shard, json.dumps(task), task_cost(task)) for task in tasks])
+        db.execute("COMMIT")
+        ntasks += len(tasks)
+    return ntasks
+
+
+def claim(db, worker, lease):
+    """Leases the most expensive task which is pending or whose lease expired (its worker
+    stopped sending heartbeats), as (task id, shard id, task), or None."""
+    now = time.time()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        row = db.execute("SELECT id, shard, task FROM tasks WHERE state = 'pending' "
+                         "OR (state = 'leased' AND lease_expires < ?) ORDER BY cost DESC LIMIT 1", (now,)).fetchone()
+        if row is not None:
+            db.execute("UPDATE tasks SET state = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1 "
+                       "WHERE id = ?", (worker, now + lease, row[0]))
+    finally:
+        db.execute("COMMIT")
+    return row
+
+
+def complete(db, worker, task_id, shard, records):
+    """Stores the records of a task, unless its lease was lost to another worker in the
+    meantime, so that every task has its results stored exactly once."""
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        updated = db.execute("UPDATE tasks SET state = 'done' WHERE id = ? AND worker = ? AND state = 'leased'",
+                             (task_id, worker)).rowcount
+        if updated:
+            db.executemany("INSERT INTO results (shard, task, record) VALUES (?, ?, ?)",
+                           [(shard, task_id, rec.record_line(record)) for record in records])
+            db.execute("UPDATE workers SET ntasks = ntasks + 1 WHERE name = ?", (worker,))
+    finally:
+        db.execute("COMMIT")
+    return bool(updated)
+
+
+class Heartbeat(object):
+    """Thread renewing the heartbeat of a worker and the leases of its tasks every `interval`
+    seconds, with a connection of its own."""
+
+    def __init__(self, path, worker, lease, interval):
+        self.path = path
+        self.worker = worker
+        self.lease = lease
+        self.interval = interval
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        # waiting longer than an interval for the lock is no use, the next tick tries again
+        db = connect(self.path, timeout=self.interval)
+        try:
+            while not self.stop.wait(self.interval):
+                now = time.time()
+                try:
+                    db.execute("BEGIN IMMEDIATE")
+                    db.execute("UPDATE workers SET heartbeat = ? WHERE name = ?", (now, self.worker))
+                    db.execute("UPDATE tasks SET lease_expires = ? WHERE worker = ? AND state = 'leased'",
+                               (now + self.lease, self.worker))
+                    db.execute("COMMIT")
+                except sqlite3.OperationalError:
+                    # the database was locked (or the filesystem failed) for the whole interval
+                    if db.in_transaction:
+                        db.execute("ROLLBACK")
+        finally:
+            db.close()
+
+    def close(self):
+        self.stop.set()
+        self.thread.join()
+
+
+def remaining_tasks(db):
+    return db.execute("SELECT COUNT(*) FROM tasks WHERE state != 'done'").fetchone()[0]
+
+
+def work(path, lease=600, heartbeat=60, poll=30, max_tasks=None, telemetry=None):
+    """Runs the tasks of the queue one after the other until all of them are done (or
+    max_tasks were run), waiting for the leases of other workers to expire or complete.
+    A Telemetry gets every sample and the number of tasks left in the whole queue."""
+    db = connect(path)
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    now = time.time()
+    db.execute("INSERT OR REPLACE INTO workers (name, host, pid, started, heartbeat) VALUES (?, ?, ?, ?, ?)",
+               (worker, socket.gethostname(), os.getpid(), now, now))
+    beat = Heartbeat(path, worker, lease, heartbeat)
+    if telemetry is not None:
+        telemetry.set_queue_depth(remaining_tasks(db))
+    current_shard, ntasks = None, 0
+    try:
+        while max_tasks is None or ntasks < max_tasks:
+            claimed = claim(db, worker, lease)
+            if claimed is None:
+                if remaining_tasks(db) == 0:
+                    break
+                # the remaining tasks are leased by other workers
+                time.sleep(poll)
+                continue
+            task_id, shard, task = claimed
+            if shard != current_shard:
+                N, args, entropy = db.execute("SELECT N, args, entropy FROM shards WHERE id = ?", (shard,)).fetchone()
+                args = argparse.Namespace(**json.loads(args))
+                script.init_worker({N: (args, int(entropy))}, script.load_strategy_table(args))
+                current_shard = shard
+            N, it, points, seed_key = json.loads(task)
+            N, results = script.run_task((N, it, [tuple(point) for point in points], tuple(seed_key)))
+            records = [rec.make_record(N, it, point, output_dict, timings)
+                       for it, point, output_dict, timings in results]
+            if not complete(db, worker, task_id, shard, records):
+                print(f"{worker} lost the lease of task {task_id}, its results were dropped")
+            ntasks += 1
+            if telemetry is not None:
+                for record in records:
+                    telemetry.add(N, record['p'], record.get('timings', {}))
+                telemetry.task_done(remaining_tasks(db))
+    finally:
+        if telemetry is not None:
+            telemetry.close()
+        beat.close()
+        db.close()
+    return ntasks
+
+
+def status(db):
+    tasks = db.execute("SELECT shards.N, tasks.state, COUNT(*) FROM tasks JOIN shards ON tasks.shard = shards.id "
+                       "GROUP BY shards.N, tasks.state ORDER BY shards.N").fetchall()
+    workers = db.execute("SELECT name, heartbeat, ntasks FROM workers ORDER BY started").fetchall()
+    return tasks, workers
+
+
+def export(db):
+    """Writes the records, csv files and manifest of every shard from the stored results,
+    as percolation_script.py would have. Returns the records paths."""
+    paths = []
+    for shard, records_path, args in db.execute("SELECT id, records_path, args FROM shards").fetchall():
+        lines = [line for line, in db.execute("SELECT record FROM results WHERE shard = ? ORDER BY id", (shard,))]
+        tmp_path = f"{records_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as file:
+            file.write(''.join(lines))
+        os.replace(tmp_path, records_path)
+
+        tables = rec.ResultTables(json.loads(args)['niterations'])
+        for line in lines:
+            tables.add_record(json.loads(line))
+        data_path = os.path.splitext(records_path)[0] + '.csv'
+        tables.save(data_path, rec.streamed_path(data_path))
+        pending, = db.execute("SELECT COUNT(*) FROM tasks WHERE shard = ? AND state != 'done'", (shard,)).fetchone()
+        if pending == 0:
+            shards.finish_manifest(records_path)
+        paths.append(records_path)
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Work queue of percolation_script.py tasks in a SQLite database, "
+                                                 "shared by workers on any host which sees the database file.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    submit_parser = commands.add_parser(
+        'submit', help="add the tasks of a sweep (as for sweep.py, unknown arguments go to percolation_script.py)")
+    submit_parser.add_argument("db", help="path of the database")
+    sweep.add_sweep_arguments(submit_parser)
+    worker_parser = commands.add_parser('worker', help="run tasks until the queue is done")
+    worker_parser.add_argument("db", help="path of the database")
+    worker_parser.add_argument("--lease", type=float, default=600,
+                               help="seconds after the last heartbeat at which a task is given to another worker")
+    worker_parser.add_argument("--heartbeat", type=float, default=60, help="seconds between heartbeats")
+    worker_parser.add_argument("--poll", type=float, default=30,
+                               help="seconds between checks while the remaining tasks are leased by others")
+    worker_parser.add_argument("--max_tasks", type=int, help="stop after this many tasks")
+    worker_parser.add_argument("--metrics", help="JSON lines metrics file of this worker (see telemetry.py), "
+                                                 "one per worker since the rotation isn't shared between processes")
+    worker_parser.add_argument("--metrics_interval", type=float, default=30, help="seconds between metrics snapshots")
+    status_parser = commands.add_parser('status', help="tasks per N and state, and the workers")
+    status_parser.add_argument("db", help="path of the database")
+    export_parser = commands.add_parser('export', help="write the data files of the shards from the results")
+    export_parser.add_argument("db", help="path of the database")
+    args, script_argv = parser.parse_known_args()
+    if script_argv and args.command != 'submit':
+        parser.error(f"unrecognized arguments: {' '.join(script_argv)}")
+
+    if args.command == 'submit':
+        save_path, run_args = sweep.sweep_arguments(args, script_argv)
+        db = connect(args.db)
+        done = {run.N: sweep.stored_keys(run) | queued_keys(db, run) for run in run_args}
+        print(f"submitted {submit(db, run_args, done, sweep.sweep_task_cost(args))} tasks")
+    elif args.command == 'worker':
+        telemetry = tel.Telemetry(args.metrics, args.metrics_interval) if args.metrics else None
+        ntasks = work(args.db, args.lease, args.heartbeat, args.poll, args.max_tasks, telemetry)
+        print(f"worker done after {ntasks} tasks")
+    elif args.command == 'status':
+        tasks, workers = status(connect(args.db))
+        for N, state, count in tasks:
+            print(f"N = {N}: {count} {state}")
+        for name, heartbeat, ntasks in workers:
+            print(f"{name}: {ntasks} tasks, last heartbeat {time.time() - heartbeat:.0f} s ago")
+    elif args.command == 'export':
+        for path in export(connect(args.db)):
+            print(f"exported {path}")
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+import percolation.gf2 as gf2
+
+
+def reference_rank(matrix):
+    # row reduction on python ints, one bit per column
+    rows = [int(''.join('1' if bit else '0' for bit in row) or '0', 2) for row in matrix]
+    rank = 0
+    while rows:
+        pivot = rows.pop()
+        if pivot:
+            rank += 1
+            top = pivot.bit_length() - 1
+            rows = [row ^ pivot if row >> top & 1 else row for row in rows]
+    return rank
+
+
+@pytest.mark.parametrize('shape', [(5, 5), (10, 70), (70, 10), (65, 130), (130, 129), (0, 4)])
+def test_rank_of_random_matrices(shape):
+    rng = np.random.default_rng(sum(shape))
+    for density in [0.05, 0.5]:
+        matrix = rng.random(shape) < density
+        # dependent rows, so that the rank is below min(shape)
+        if shape[0] > 2:
+            matrix[-1] = matrix[0] ^ matrix[1]
+        assert gf2.rank(matrix) == reference_rank(matrix)
+
+
+def test_pack_rows_round_trips():
+    matrix = np.random.default_rng(0).random((7, 130)) < 0.5
+    assert (gf2.unpack_rows(gf2.pack_rows(matrix), 130) == matrix).all()
@@ -0,0 +1,57 @@
+import networkx as nx
+import numpy as np
+import pytest
+import pyzx as zx
+import scipy.sparse
+import percolation.maxflow as mf
+import percolation.sparse_graph as sg
+import percolation.util_functions as uf
+
+
+def simplified_circuit(seed, N=8, t_factor=1, periodic=False, p=0.3):
+    """(string circuit, fully reduced diagram) of a random circuit, as in general_single_iteration."""
+    uf.rng = np.random.default_rng(seed)
+    string_circuit = uf.sample_string_circuit(N, t_factor, p, 0.5, 0.5, periodic)
+    g = uf.sample_circuit(N, t_factor, string_circuit=string_circuit, periodic=periodic)
+    uf.simplify_circuit(g, quiet=True, simp_method=zx.full_reduce)
+    return string_circuit, g
+
+
+def networkx_min_cut(adjacency, sources, sinks):
+    if set(sources) & set(sinks):
+        return np.inf
+    G = nx.DiGraph()
+    G.add_nodes_from(['source', 'sink'])
+    for u, v in zip(*adjacency.nonzero()):
+        if u != v:
+            G.add_edge(u, v, capacity=1)
+    # no capacity means an infinite one
+    G.add_edges_from(('source', s) for s in sources)
+    G.add_edges_from((t, 'sink') for t in sinks)
+    return nx.minimum_cut_value(G, 'source', 'sink')
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_max_flow_of_random_graphs(seed):
+    rng = np.random.default_rng(seed)
+    n = 30
+    upper = scipy.sparse.random(n, n, density=0.1, random_state=rng, format='csr') > 0
+    adjacency = scipy.sparse.triu(upper, 1)
+    adjacency = (adjacency + adjacency.T).astype(int).tocsr()
+    vertices = rng.permutation(n)
+    sources, sinks = vertices[:4].tolist(), vertices[4:9].tolist()
+    assert mf.FlowNetwork(adjacency).max_flow(sources, sinks) == networkx_min_cut(adjacency, sources, sinks)
+
+
+@pytest.mark.parametrize('seed', range(6))
+def test_cut_profile_of_random_diagrams(seed):
+    periodic = seed % 2 == 1
+    _, g = simplified_circuit(seed, periodic=periodic)
+    diagram = sg.pyzx_to_csr(g)
+    outputs = list(diagram.outputs)
+    for start in [0, 3]:
+        # the flow is carried over from one size to the next, each cut is checked on its own
+        profile = mf.cut_profile(diagram, start=start)
+        rotated = outputs[start:] + outputs[:start]
+        expected = [networkx_min_cut(diagram.adjacency, rotated[:l], rotated[l:]) for l in range(1, len(outputs) // 2 + 1)]
+        assert profile == expected
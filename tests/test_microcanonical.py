@@ -0,0 +1,15 @@
+import numpy as np
+import pytest
+import percolation.microcanonical as mc
+import percolation.spacetime as spt
+
+
+@pytest.mark.parametrize('periodic', [False, True])
+def test_sweep_observables_are_those_of_the_canonical_circuits(periodic):
+    mc.rng = np.random.default_rng(3)
+    sweep = mc.Sweep(8, 2, 0.4, 0.5, periodic)
+    values = mc.sweep_observables(sweep)
+    for n in range(0, sweep.nslots + 1, 5):
+        spacetime = spt.spacetime_graph(sweep.string_circuit(n), 8, periodic)
+        assert values['largest_spacetime_cluster'][n] == pytest.approx(spt.largest_cluster(spacetime))
+        assert values['spans_time'][n] == spt.wrapping_observables(spacetime, periodic)[2]
@@ -0,0 +1,8 @@
+import pytest
+import percolation.records as rec
+
+
+def test_writer_reports_a_file_it_cannot_open(tmp_path):
+    writer = rec.RecordWriter(str(tmp_path / 'missing' / 'data.jsonl'))
+    with pytest.raises(OSError):
+        writer.close()
@@ -0,0 +1,9 @@
+import percolation.percolation_script as script
+import percolation.refine as refine
+
+
+def test_rounds_draw_new_seeds(tmp_path):
+    argv = ['--seed', '1', '--niterations', '2']
+    first = script.make_tasks(refine.round_arguments(str(tmp_path), 8, [0.15, 0.2], argv))
+    second = script.make_tasks(refine.round_arguments(str(tmp_path), 8, [0.175], argv))
+    assert not {task[3] for task in first} & {task[3] for task in second}
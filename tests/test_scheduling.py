@@ -0,0 +1,21 @@
+import numpy as np
+import pandas
+import pytest
+import percolation.scheduling as sch
+
+
+def timings(Ns, ps, q=0.5, r=0.1):
+    rows = [{'N': N, 'p': p, 'q': q, 'r': r, 'simplify': 1e-3 * N ** 2 * np.exp(p)} for N in Ns for p in ps]
+    return pandas.DataFrame(rows)
+
+
+def test_cost_model_leaves_out_constant_features():
+    model = sch.fit_cost_model(timings([8, 12, 16], [0.1, 0.2, 0.3]))
+    assert model.cost(24, 0.2, 0.5, 0.1) == pytest.approx(1e-3 * 24 ** 2 * np.exp(0.2))
+    # q and r were the same in all the timings
+    assert model.cost(24, 0.2, 0.9, 0.9) == pytest.approx(model.cost(24, 0.2, 0.5, 0.1))
+
+
+def test_cost_model_needs_two_sizes():
+    with pytest.raises(ValueError):
+        sch.fit_cost_model(timings([8], [0.1, 0.2, 0.3]))
@@ -0,0 +1,32 @@
+import numpy as np
+import percolation.percolation_script as script
+import percolation.util_functions as uf
+
+
+def first_variates(task, entropy, t_factor=2):
+    # the slot variates run_task would draw for this task
+    N, _, _, seed_key = task
+    uf.rng = np.random.default_rng([entropy, *seed_key])
+    return uf.sample_slot_variates(N, t_factor)
+
+
+def test_sizes_draw_independent_circuits():
+    for extra in [[], ['--seed_by_point'], ['--coupled']]:
+        tasks = {}
+        for N in [8, 12]:
+            args = script.parse_args(['-N', str(N), '--t_factor', '2', '--niterations', '2',
+                                      '-p', '0.3', '--seed', '1', *extra])
+            tasks[N] = script.make_tasks(args)[0]
+        # the same (iteration, point) at both sizes
+        assert tasks[8][1:3] == tasks[12][1:3]
+        assert tasks[8][3] != tasks[12][3]
+        # with a shared stream the first variates drawn would be the same at both sizes
+        measure8 = first_variates(tasks[8], 1)[0].ravel()
+        measure12 = first_variates(tasks[12], 1)[0].ravel()
+        assert not np.allclose(measure8[:16], measure12[:16])
+
+
+def test_same_size_same_seed_draws_the_same_circuit():
+    args = script.parse_args(['-N', '8', '--niterations', '1', '-p', '0.3', '--seed', '1'])
+    task = script.make_tasks(args)[0]
+    assert np.array_equal(first_variates(task, 1)[0], first_variates(task, 1)[0])
@@ -0,0 +1,49 @@
+import os
+import pytest
+import percolation.percolation_script as script
+import percolation.records as rec
+import percolation.shards as shards
+
+
+def make_shard(path, N=8):
+    os.makedirs(path, exist_ok=True)
+    args = script.parse_args(['-N', str(N), '--niterations', '2', '-p', '0.3', '--seed', '1',
+                              '--save_path', str(path)])
+    records_path = os.path.join(path, os.path.splitext(shards.allocate_shard(path))[0] + '.jsonl')
+    shards.write_manifest(records_path, args, 1)
+    writer = rec.RecordWriter(records_path)
+    for it in range(2):
+        writer.write(rec.make_record(N, it, (0.3, 0.5, 0.1), {'lc': 0.5 + it}))
+    writer.close()
+    shards.finish_manifest(records_path)
+    return records_path
+
+
+def test_merge_refuses_a_directory_with_shards(tmp_path):
+    run = tmp_path / 'run'
+    shard = make_shard(str(run / 'N8'))
+    tables, streamed = shards.merge_shards(shards.find_shards([str(run)]))
+    with pytest.raises(Exception):
+        shards.save_merged(tables, streamed, str(run))
+    # the first shard, whose csv has the name of the merged one, is untouched
+    assert os.path.getsize(os.path.splitext(shard)[0] + '.csv') == 0
+
+
+def test_merge_into_a_directory_of_its_own(tmp_path):
+    make_shard(str(tmp_path / 'run' / 'N8'))
+    make_shard(str(tmp_path / 'run' / 'N8'))
+    tables, streamed = shards.merge_shards(shards.find_shards([str(tmp_path / 'run')]))
+    shards.save_merged(tables, streamed, str(tmp_path / 'merged'))
+    assert len(tables[8]) == 4
+    assert os.path.isfile(tmp_path / 'merged' / 'N8' / 'data.csv')
+
+
+@pytest.mark.parametrize('argv', [['-N', '10'], ['--t_factor', '3'], ['--periodic'], ['--coupled'],
+                                  ['--seed', '2'], ['--seed_by_point'], ['--microcanonical'],
+                                  ['--simp_method', 'clifford_simp'], ['--strategy_table', 'table.csv'],
+                                  ['--observables', 'lc']])
+def test_resume_refuses_other_runs(tmp_path, argv):
+    records_path = make_shard(str(tmp_path))
+    with pytest.raises(Exception):
+        script.ShardRun(script.parse_args(['-N', '8', '-p', '0.3', '--save_path', str(tmp_path),
+                                           '--resume', records_path] + argv))
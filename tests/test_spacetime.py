@@ -0,0 +1,29 @@
+import percolation.spacetime as spt
+
+
+def wrapping(string_circuit, N=4):
+    return spt.wrapping_observables(spt.spacetime_graph(string_circuit, N, periodic=True), periodic=True)
+
+
+def test_a_cluster_across_the_periodic_boundary_does_not_span():
+    # one bell pair between qubits 3 and 0, across the boundary
+    wraps_space, spans_space, _ = wrapping([['id_projection', 'id_projection'], ['id_projection', 'bell_projection']])
+    assert not wraps_space and not spans_space
+
+
+def test_a_periodic_cluster_spans_without_winding():
+    # bell pairs (0, 1), (2, 3) then (1, 2) join qubits 0 to 3 through the bulk
+    wraps_space, spans_space, _ = wrapping([['bell_projection', 'bell_projection'], ['bell_projection', 'id_projection']])
+    assert not wraps_space and spans_space
+
+
+def test_a_winding_cluster_spans():
+    wraps_space, spans_space, _ = wrapping([['bell_projection', 'bell_projection'], ['bell_projection', 'bell_projection']])
+    assert wraps_space and spans_space
+
+
+def test_open_circuits_span_from_the_first_to_the_last_qubit():
+    spacetime = spt.spacetime_graph([['bell_projection', 'bell_projection'], ['bell_projection', 'id_projection']], 4)
+    assert spt.wrapping_observables(spacetime)[1]
+    spacetime = spt.spacetime_graph([['bell_projection', 'bell_projection'], ['id_projection', 'id_projection']], 4)
+    assert not spt.wrapping_observables(spacetime)[1]
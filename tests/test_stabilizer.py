@@ -0,0 +1,17 @@
+import pytest
+import percolation.graph_state as gs
+import percolation.stabilizer as stab
+from test_maxflow import simplified_circuit
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_tableau_and_graph_state_entropies_agree(seed):
+    N, periodic = 12, seed % 2 == 1
+    string_circuit, g = simplified_circuit(seed, N=N, periodic=periodic)
+    state = gs.graph_state(gs.reduced_state(g))
+    tableau = stab.simulate(string_circuit, N, periodic)
+    A, B = stab.antipodal_regions(N)
+    for subsystem in [A, B, A + B, list(range(N // 2)), [0, 4, 5, 9]]:
+        assert tableau.entropy(subsystem) == state.entropy(subsystem)
+    mutual_information = state.entropy(A) + state.entropy(B) - state.entropy(A + B)
+    assert stab.antipodal_mutual_information(tableau) == mutual_information
@@ -0,0 +1,20 @@
+import percolation.percolation_script as script
+import percolation.sweep as sweep
+from test_shards import make_shard
+
+
+def test_stored_samples_of_another_engine_are_not_reused(tmp_path):
+    make_shard(str(tmp_path))
+    argv = ['-N', '8', '--niterations', '2', '-p', '0.3', '--seed', '1', '--save_path', str(tmp_path)]
+    assert len(sweep.stored_keys(script.parse_args(argv))) == 2
+    assert not sweep.stored_keys(script.parse_args(argv + ['--simp_method', 'clifford_simp']))
+
+
+def test_sweeps_are_found_as_runs(tmp_path):
+    sweep.write_run_script(str(tmp_path), ['sweep.py', '-N', '8', '12', '--seed', '1'])
+    with open(tmp_path / 'run_script.sh') as file:
+        assert file.read().splitlines()[-1] == 'python -m percolation.sweep -N 8 12 --seed 1'
+    # a run_script.sh already there is the one of the run
+    sweep.write_run_script(str(tmp_path), ['sweep.py', '-N', '16'])
+    with open(tmp_path / 'run_script.sh') as file:
+        assert '-N 8 12' in file.read()
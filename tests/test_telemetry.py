@@ -0,0 +1,15 @@
+import json
+import percolation.telemetry as tel
+
+
+def test_the_last_snapshot_of_a_run_is_not_stalled(tmp_path):
+    path = str(tmp_path / 'metrics.jsonl')
+    telemetry = tel.Telemetry(path, interval=60)
+    # a run stopped with tasks left, right after a snapshot
+    telemetry.set_queue_depth(3)
+    telemetry.close()
+    with open(path) as file:
+        snapshots = [json.loads(line) for line in file]
+    assert snapshots[-1]['final']
+    assert 'STALLED' not in tel.format_snapshot(snapshots[-1])
+    assert 'STALLED' in tel.format_snapshot(dict(snapshots[-1], final=False))
@@ -0,0 +1,20 @@
+import time
+import percolation.work_queue as wq
+
+
+def test_heartbeat_survives_a_locked_database(tmp_path, monkeypatch):
+    path = str(tmp_path / 'queue.db')
+    db = wq.connect(path)
+    db.execute("INSERT INTO workers (name, heartbeat) VALUES ('worker', 0)")
+    # the heartbeat gives up waiting for the lock after a few milliseconds
+    connect = wq.connect
+    monkeypatch.setattr(wq, 'connect', lambda path, timeout=60: connect(path, timeout=0.01))
+    heartbeat = wq.Heartbeat(path, 'worker', lease=60, interval=0.1)
+    db.execute("BEGIN IMMEDIATE")
+    time.sleep(0.5)
+    locked = time.time()
+    db.execute("COMMIT")
+    time.sleep(0.5)
+    assert heartbeat.thread.is_alive()
+    assert db.execute("SELECT heartbeat FROM workers").fetchone()[0] > locked
+    heartbeat.close()
@@ -529,18 +529,20 @@ def is_graph_like(g: BaseGraph[VT,ET], strict:bool=False) -> bool:
     If `strict` is True, then also checks that each boundary vertex is connected to a Z-spider,
     and that each Z-spider is connected to at most one boundary."""
 
+    ty = g.types()
+
     # checks that all spiders are Z-spiders
     for v in g.vertices():
-        if g.type(v) not in [VertexType.Z, VertexType.BOUNDARY]:
+        if ty[v] not in [VertexType.Z, VertexType.BOUNDARY]:
             return False
 
-    for v1, v2 in itertools.combinations(g.vertices(), 2):
-        if not g.connected(v1, v2):
-            continue
+    # iterate over the edges rather than over all vertex pairs, which is O(V^2)
+    for e in g.edges():
+        v1, v2 = g.edge_st(e)
 
         # Z-spiders are only connected via Hadamard edges
-        if g.type(v1) == VertexType.Z and g.type(v2) == VertexType.Z \
-           and g.edge_type(g.edge(v1, v2)) != EdgeType.HADAMARD:
+        if ty[v1] == VertexType.Z and ty[v2] == VertexType.Z \
+           and g.edge_type(e) != EdgeType.HADAMARD:
             return False
 
         # FIXME: no parallel edges
@@ -552,17 +554,15 @@ def is_graph_like(g: BaseGraph[VT,ET], strict:bool=False) -> bool:
 
     if strict:
         # every I/O is connected to a Z-spider
-        bs = [v for v in g.vertices() if g.type(v) == VertexType.BOUNDARY]
+        bs = [v for v in g.vertices() if ty[v] == VertexType.BOUNDARY]
         for b in bs:
-            if g.vertex_degree(b) != 1 or g.type(list(g.neighbors(b))[0]) != VertexType.Z:
+            if g.vertex_degree(b) != 1 or ty[next(iter(g.neighbors(b)))] != VertexType.Z:
                 return False
 
-        # every Z-spider is connected to at most one I/O
-        zs = [v for v in g.vertices() if g.type(v) == VertexType.Z]
-        for z in zs:
-            b_neighbors = [n for n in g.neighbors(z) if g.type(n) == VertexType.BOUNDARY]
-            if len(b_neighbors) > 1:
-                return False
+        # every Z-spider is connected to at most one I/O, i.e. no two boundaries share a neighbor
+        b_neighbors = [next(iter(g.neighbors(b))) for b in bs]
+        if len(set(b_neighbors)) != len(b_neighbors):
+            return False
 
     return True
 